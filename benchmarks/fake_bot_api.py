@@ -0,0 +1,178 @@
+"""Local stand-in for the Telegram Bot API used by the load-test harness.
+
+Answers the methods copycat calls with plausible results, serves queued
+synthetic updates through getUpdates, and can inject latency, RetryAfter
+(429) and error responses on the sending methods.
+"""
+
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Methods that send or edit something on behalf of the bot; only these get faults injected
+SEND_METHODS = {
+    "sendMessage", "copyMessage", "sendPhoto", "editMessageMedia", "editMessageText",
+    "setMessageReaction", "sendChatAction", "deleteMessage",
+}
+
+
+class FakeBotAPI:
+    """aiohttp server implementing the subset of the Bot API copycat uses."""
+
+    def __init__(self, latency=0.0, jitter=0.0, retry_after_rate=0.0, retry_after=1,
+                 error_rate=0.0, blocked_rate=0.0, bot_id=42, on_request=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.blocked_rate = blocked_rate
+        self.bot_id = bot_id
+        # Called as on_request(method, params) for every successful call
+        self.on_request = on_request
+        self.calls = Counter()
+        self.faults = Counter()
+        self._updates = []
+        self._new_updates = asyncio.Event()
+        self._message_id = 0
+        self._runner = None
+        self.url = None
+
+    def enqueue(self, updates):
+        """Make updates available to getUpdates."""
+        self._updates.extend(updates)
+        self._new_updates.set()
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving and return the base URL to use as TELEGRAM_API_URL."""
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{bound_port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = await self._params(request)
+
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(params))
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if method in SEND_METHODS:
+            fault = self._fault()
+            if fault:
+                self.faults[fault[0]] += 1
+                return fault[1]
+
+        result = self._result(method, params)
+        if result is None:
+            return web.json_response({"ok": False, "error_code": 404, "description": "Not Found: method not found"}, status=404)
+        if self.on_request is not None:
+            self.on_request(method, params)
+        return self._ok(result)
+
+    @staticmethod
+    async def _params(request):
+        params = {}
+        for key, value in (await request.post()).items():
+            if isinstance(value, str):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            params[key] = value
+        return params
+
+    def _fault(self):
+        roll = random.random()
+        if roll < self.retry_after_rate:
+            return "retry_after", web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        roll -= self.retry_after_rate
+        if roll < self.blocked_rate:
+            return "blocked", web.json_response({
+                "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user",
+            }, status=403)
+        roll -= self.blocked_rate
+        if roll < self.error_rate:
+            return "error", web.json_response({
+                "ok": False, "error_code": 500, "description": "Internal Server Error",
+            }, status=500)
+        return None
+
+    async def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        # Everything below offset has been confirmed by the client
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _message(self, chat_id, **extra):
+        self._message_id += 1
+        chat_id = int(chat_id)
+        chat = {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}
+        if chat_id < 0:
+            chat["title"] = f"Group {chat_id}"
+        else:
+            chat["first_name"] = f"User {chat_id}"
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": {"id": self.bot_id, "is_bot": True, "first_name": "copycat", "username": "copycat_bot"},
+        }
+        message.update(extra)
+        return message
+
+    def _photo(self):
+        file_id = f"photo-{self._message_id + 1}"
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 720}]
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return {"id": self.bot_id, "is_bot": True, "first_name": "copycat", "username": "copycat_bot"}
+        if method in ("setMyCommands", "deleteWebhook", "setWebhook", "setMessageReaction",
+                      "sendChatAction", "deleteMessage"):
+            return True
+        if method == "sendMessage":
+            return self._message(params["chat_id"], text=str(params.get("text", "")))
+        if method == "editMessageText":
+            return self._message(params["chat_id"], text=str(params.get("text", "")))
+        if method == "copyMessage":
+            self._message_id += 1
+            return {"message_id": self._message_id}
+        if method in ("sendPhoto", "editMessageMedia"):
+            return self._message(params["chat_id"], photo=self._photo())
+        return None
+
+    @staticmethod
+    def _ok(result):
+        return web.json_response({"ok": True, "result": result})
@@ -0,0 +1,166 @@
+"""Local stand-in for the Wallhaven search API.
+
+Serves /api/v1/search with a configurable number of results, a latency
+distribution, and injected failure modes (HTTP errors, hangs, malformed
+JSON and empty result sets). Every result path is unique, so nothing is
+served from copycat's file_id cache by accident.
+
+    python benchmarks/fake_wallhaven.py --port 8090 --latency-ms 150 --distribution lognormal
+"""
+
+import argparse
+import asyncio
+import math
+import random
+from collections import Counter
+
+from aiohttp import web
+
+DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+class FakeWallhaven:
+    """aiohttp server answering Wallhaven search requests."""
+
+    def __init__(self, results=24, latency=0.15, distribution="fixed", spread=0.5,
+                 tail_rate=0.0, tail_latency=2.0, error_rate=0.0, hang_rate=0.0, hang=30.0,
+                 malformed_rate=0.0, empty_rate=0.0):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {', '.join(DISTRIBUTIONS)}")
+        self.results = results
+        self.latency = latency
+        self.distribution = distribution
+        self.spread = spread
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang = hang
+        self.malformed_rate = malformed_rate
+        self.empty_rate = empty_rate
+        self.requests = 0
+        self.outcomes = Counter()
+        self._image_id = 0
+        self._runner = None
+        self.url = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving and return the search URL to use as WALLHAVEN_API_URL."""
+        app = web.Application()
+        app.router.add_get("/api/v1/search", self._search)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{bound_port}/api/v1/search?q=flower&sorting=random"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def sample_latency(self):
+        """Draw one response latency in seconds."""
+        if random.random() < self.tail_rate:
+            return self.tail_latency
+        if self.distribution == "uniform":
+            return max(0.0, random.uniform(self.latency * (1 - self.spread), self.latency * (1 + self.spread)))
+        if self.distribution == "lognormal" and self.latency > 0:
+            # Median at self.latency, spread is the sigma of the underlying normal
+            return random.lognormvariate(math.log(self.latency), self.spread)
+        return self.latency
+
+    def _outcome(self):
+        roll = random.random()
+        for outcome, rate in (("error", self.error_rate), ("hang", self.hang_rate),
+                              ("malformed", self.malformed_rate), ("empty", self.empty_rate)):
+            if roll < rate:
+                return outcome
+            roll -= rate
+        return "ok"
+
+    async def _search(self, request):
+        self.requests += 1
+        outcome = self._outcome()
+        self.outcomes[outcome] += 1
+        await asyncio.sleep(self.hang if outcome == "hang" else self.sample_latency())
+
+        if outcome == "error":
+            return web.json_response({"error": "Service Unavailable"}, status=503)
+        if outcome == "malformed":
+            return web.Response(text='{"data": [', content_type="application/json")
+        if outcome == "empty":
+            return web.json_response({"data": [], "meta": {"total": 0}})
+
+        data = []
+        for _ in range(self.results):
+            self._image_id += 1
+            image_id = f"{self._image_id:06x}"
+            data.append({
+                "id": image_id,
+                "path": f"https://w.wallhaven.example/full/{image_id[:2]}/wallhaven-{image_id}.jpg",
+                "resolution": "1920x1080",
+                "file_type": "image/jpeg",
+            })
+        return web.json_response({"data": data, "meta": {"current_page": 1, "per_page": self.results}})
+
+
+def add_arguments(parser, prefix=""):
+    """Register the fake server's options, optionally under a prefix such as "wh-"."""
+    parser.add_argument(f"--{prefix}results", type=int, default=24, help="images per search response")
+    parser.add_argument(f"--{prefix}latency-ms", type=float, default=150.0, help="median response latency")
+    parser.add_argument(f"--{prefix}distribution", choices=DISTRIBUTIONS, default="lognormal")
+    parser.add_argument(f"--{prefix}spread", type=float, default=0.5,
+                        help="relative half-width (uniform) or sigma (lognormal)")
+    parser.add_argument(f"--{prefix}tail-rate", type=float, default=0.0, help="share of responses with tail latency")
+    parser.add_argument(f"--{prefix}tail-ms", type=float, default=2000.0, help="tail latency")
+    parser.add_argument(f"--{prefix}error-rate", type=float, default=0.0, help="share of 503 responses")
+    parser.add_argument(f"--{prefix}hang-rate", type=float, default=0.0, help="share of responses that hang")
+    parser.add_argument(f"--{prefix}hang-ms", type=float, default=30000.0, help="how long a hang lasts")
+    parser.add_argument(f"--{prefix}malformed-rate", type=float, default=0.0, help="share of truncated JSON bodies")
+    parser.add_argument(f"--{prefix}empty-rate", type=float, default=0.0, help="share of empty result sets")
+
+
+def from_arguments(args, prefix=""):
+    """Build a FakeWallhaven from options registered by add_arguments."""
+    option = lambda name: getattr(args, (prefix + name).replace("-", "_"))  # noqa: E731
+    return FakeWallhaven(
+        results=option("results"),
+        latency=option("latency-ms") / 1000,
+        distribution=option("distribution"),
+        spread=option("spread"),
+        tail_rate=option("tail-rate"),
+        tail_latency=option("tail-ms") / 1000,
+        error_rate=option("error-rate"),
+        hang_rate=option("hang-rate"),
+        hang=option("hang-ms") / 1000,
+        malformed_rate=option("malformed-rate"),
+        empty_rate=option("empty-rate"),
+    )
+
+
+async def serve(args):
+    server = from_arguments(args)
+    url = await server.start(args.host, args.port)
+    print(f"Fake Wallhaven listening; set WALLHAVEN_API_URL={url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Wallhaven search API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    add_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
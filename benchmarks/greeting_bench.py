@@ -0,0 +1,230 @@
+"""Greeting latency benchmark for the fetch_image -> send_image path.
+
+Runs the real handlers against a fake Bot API and a fake Wallhaven
+server. It sends bursts of keyword messages at increasing concurrency
+and measures each greeting from the moment the update is handed to the
+application until the fake Bot API receives its photo. Results go to
+stdout as JSON, so two runs can be compared:
+
+    python benchmarks/greeting_bench.py --output before.json
+    python benchmarks/greeting_bench.py --compare before.json --tolerance 0.15
+
+With --compare, the exit status is 1 if p50 or p99 at any concurrency
+level regressed by more than the tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_wallhaven  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+GROUP_BASE = -1002000000000
+PHOTO_METHODS = ("sendPhoto", "editMessageMedia")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32,64",
+                        help="comma-separated burst sizes to measure")
+    parser.add_argument("--rounds", type=int, default=3, help="bursts per concurrency level")
+    parser.add_argument("--warmup", type=int, default=2, help="unrecorded greetings before measuring")
+    parser.add_argument("--pool-size", type=int, default=0,
+                        help="IMAGE_POOL_SIZE; 0 forces a live fetch for every burst")
+    parser.add_argument("--api-latency-ms", type=float, default=20.0, help="fake Bot API latency")
+    parser.add_argument("--api-jitter-ms", type=float, default=5.0)
+    fake_wallhaven.add_arguments(parser, prefix="wh-")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed relative increase in p50/p99 before flagging a regression")
+    return parser.parse_args()
+
+
+def configure_environment(args, api_url, wallhaven_url, workdir):
+    """Set copycat's configuration before it is imported."""
+    defaults = {
+        "BOT_TOKEN": "123456:BENCH",
+        "TELEGRAM_API_URL": api_url,
+        "WALLHAVEN_API_URL": wallhaven_url,
+        "IMAGE_SOURCES": "wallhaven",
+        "IMAGE_POOL_SIZE": str(args.pool_size),
+        "PORT": "0",
+        "LOG_LEVEL": "ERROR",
+        "FLOOD_CHAT_BURST": "1000000",
+        "FLOOD_USER_BURST": "1000000",
+        "CHAT_DB_PATH": os.path.join(workdir, "chats.db"),
+        "BROADCAST_JOBS_DIR": os.path.join(workdir, "broadcast_jobs"),
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+class GreetingRunner:
+    """Sends keyword messages to fresh group chats and times each photo."""
+
+    def __init__(self, copycat, app, keyword):
+        self.copycat = copycat
+        self.app = app
+        self.keyword = keyword
+        self.photo_at = {}
+        self._next_chat = 0
+        self._update_id = 0
+
+    def on_request(self, method, params):
+        if method in PHOTO_METHODS:
+            self.photo_at.setdefault(int(params["chat_id"]), time.perf_counter())
+
+    def _update(self):
+        from telegram import Update
+
+        self._next_chat += 1
+        self._update_id += 1
+        chat_id = GROUP_BASE - self._next_chat
+        user_id = 1000 + self._next_chat
+        data = {
+            "update_id": self._update_id,
+            "message": {
+                "message_id": self._update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup", "title": f"Bench {self._next_chat}"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+                "text": f"hey {self.keyword}",
+            },
+        }
+        return chat_id, Update.de_json(data, self.app.bot)
+
+    async def burst(self, size):
+        """Trigger size greetings at once; return (latencies, failures, wall seconds)."""
+        updates = [self._update() for _ in range(size)]
+        started = time.perf_counter()
+        await asyncio.gather(*(self.app.process_update(update) for _, update in updates))
+        wall = time.perf_counter() - started
+        latencies = [self.photo_at[chat_id] - started for chat_id, _ in updates if chat_id in self.photo_at]
+        return latencies, size - len(latencies), wall
+
+
+async def run(args):
+    import random
+
+    random.seed(args.seed)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    wallhaven = fake_wallhaven.from_arguments(args, prefix="wh-")
+    api = FakeBotAPI(latency=args.api_latency_ms / 1000, jitter=args.api_jitter_ms / 1000)
+    api_url = await api.start()
+    wallhaven_url = await wallhaven.start()
+
+    with tempfile.TemporaryDirectory(prefix="copycat-greeting-") as workdir:
+        configure_environment(args, api_url, wallhaven_url, workdir)
+        import copycat
+
+        app = copycat.setup_bot()
+        runner = GreetingRunner(copycat, app, copycat.TRIGGER_KEYWORDS[0])
+        api.on_request = runner.on_request
+        await app.initialize()
+        await app.post_init(app)
+
+        results = {"config": vars(args), "levels": []}
+        try:
+            for _ in range(args.warmup):
+                await runner.burst(1)
+
+            for level in levels:
+                latencies, failures, walls = [], 0, 0.0
+                fetches_before = wallhaven.requests
+                degraded_before = copycat.metrics.counter_value("image_degraded_total")
+                for _ in range(args.rounds):
+                    round_latencies, round_failures, wall = await runner.burst(level)
+                    latencies.extend(round_latencies)
+                    failures += round_failures
+                    walls += wall
+                greetings = level * args.rounds
+                results["levels"].append({
+                    "concurrency": level,
+                    "greetings": greetings,
+                    "delivered": len(latencies),
+                    "failed": failures,
+                    "degraded": copycat.metrics.counter_value("image_degraded_total") - degraded_before,
+                    "upstream_fetches": wallhaven.requests - fetches_before,
+                    "greetings_per_sec": round(greetings / walls, 1) if walls else None,
+                    "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+                    "p50_ms": ms(percentile(latencies, 0.50)),
+                    "p90_ms": ms(percentile(latencies, 0.90)),
+                    "p99_ms": ms(percentile(latencies, 0.99)),
+                    "max_ms": ms(max(latencies)) if latencies else None,
+                })
+                print(f"concurrency {level:>4}: p50 {results['levels'][-1]['p50_ms']} ms, "
+                      f"p99 {results['levels'][-1]['p99_ms']} ms, {failures} failed", file=sys.stderr)
+        finally:
+            await app.post_stop(app)
+            await app.shutdown()
+            await app.post_shutdown(app)
+            await wallhaven.stop()
+            await api.stop()
+
+    results["wallhaven"] = {"requests": wallhaven.requests, "outcomes": dict(wallhaven.outcomes)}
+    results["api_calls"] = dict(sorted(api.calls.items()))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions against a baseline run."""
+    regressions = []
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in results["levels"]:
+        old = previous.get(level["concurrency"])
+        if not old:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            if old.get(key) and level.get(key) and level[key] > old[key] * (1 + tolerance):
+                regressions.append(
+                    f"concurrency {level['concurrency']} {key}: {old[key]} -> {level[key]} "
+                    f"(+{(level[key] / old[key] - 1) * 100:.0f}%)"
+                )
+        if level["failed"] > old.get("failed", 0):
+            regressions.append(f"concurrency {level['concurrency']} failed: {old.get('failed', 0)} -> {level['failed']}")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run(args))
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results["regressions"] = regressions
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
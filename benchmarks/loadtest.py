@@ -0,0 +1,249 @@
+"""End-to-end load test of copycat against a local fake Bot API server.
+
+Builds the real application with setup_bot(), points it at FakeBotAPI,
+feeds synthetic private and group traffic through getUpdates, then runs a
+broadcast to N synthetic recipients. Reports updates/sec, p50/p99 handler
+and end-to-end latency, and broadcast completion time.
+
+    python benchmarks/loadtest.py --updates 5000 --latency-ms 30 --broadcast 300
+    python benchmarks/loadtest.py --retry-after-rate 0.01 --error-rate 0.01 --json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+OWNER_ID = 1
+GROUP_BASE = -1001000000000
+BROADCAST_BASE = 50000000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--updates", type=int, default=2000, help="synthetic updates to send")
+    parser.add_argument("--users", type=int, default=500, help="distinct private-chat users")
+    parser.add_argument("--groups", type=int, default=50, help="distinct groups")
+    parser.add_argument("--private-ratio", type=float, default=0.5, help="share of updates from private chats")
+    parser.add_argument("--start-ratio", type=float, default=0.05, help="share of private updates that are /start")
+    parser.add_argument("--keyword-ratio", type=float, default=0.2, help="share of group messages with a trigger keyword")
+    parser.add_argument("--broadcast", type=int, default=200, help="broadcast recipients (0 to skip)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake API response latency")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="uniform +/- jitter on the latency")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="share of sends answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after seconds in injected 429s")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of sends answered with 500")
+    parser.add_argument("--blocked-rate", type=float, default=0.0, help="share of sends answered with 403 blocked")
+    parser.add_argument("--flood-control", action="store_true", help="keep the production flood-control limits")
+    parser.add_argument("--timeout", type=float, default=300.0, help="give up after this many seconds per phase")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args()
+
+
+def configure_environment(args, api_url, workdir):
+    """Set copycat's configuration before it is imported."""
+    images = os.path.join(workdir, "images")
+    os.makedirs(images)
+    for index in range(64):
+        with open(os.path.join(images, f"{index:03d}.jpg"), "wb") as f:
+            f.write(b"\xff\xd8\xff\xe0" + os.urandom(2048))
+
+    defaults = {
+        "BOT_TOKEN": "123456:LOADTEST",
+        "OWNER_ID": str(OWNER_ID),
+        "TELEGRAM_API_URL": api_url,
+        "PORT": "0",
+        "LOG_LEVEL": "WARNING",
+        "IMAGE_SOURCES": "local",
+        "LOCAL_IMAGE_DIR": images,
+        "CHAT_DB_PATH": os.path.join(workdir, "chats.db"),
+        "BROADCAST_JOBS_DIR": os.path.join(workdir, "broadcast_jobs"),
+    }
+    if not args.flood_control:
+        defaults.update(FLOOD_CHAT_BURST="1000000", FLOOD_USER_BURST="1000000")
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def synthetic_updates(args, keyword):
+    """Yield Bot API update dicts mixing private chats, /start and group traffic."""
+    update_id = 1000
+    for message_id in range(1, args.updates + 1):
+        update_id += 1
+        if random.random() < args.private_ratio:
+            user_id = 1000 + random.randrange(args.users)
+            chat = {"id": user_id, "type": "private", "first_name": f"User {user_id}"}
+            if random.random() < args.start_ratio:
+                text, entities = "/start", [{"type": "bot_command", "offset": 0, "length": 6}]
+            else:
+                text, entities = f"hello {message_id}", None
+        else:
+            user_id = 1000 + random.randrange(args.users)
+            group_id = GROUP_BASE - random.randrange(args.groups)
+            chat = {"id": group_id, "type": "supergroup", "title": f"Group {group_id}"}
+            text = f"look a {keyword} over there" if random.random() < args.keyword_ratio else f"chatter {message_id}"
+            entities = None
+
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "text": text,
+        }
+        if entities:
+            message["entities"] = entities
+        yield {"update_id": update_id, "message": message}
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+async def wait_until(predicate, timeout):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+async def run(args):
+    random.seed(args.seed)
+    api = FakeBotAPI(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        retry_after_rate=args.retry_after_rate,
+        retry_after=args.retry_after,
+        error_rate=args.error_rate,
+        blocked_rate=args.blocked_rate,
+    )
+    api_url = await api.start()
+
+    with tempfile.TemporaryDirectory(prefix="copycat-loadtest-") as workdir:
+        configure_environment(args, api_url, workdir)
+        import copycat
+        from telegram import Update
+        from telegram.ext import TypeHandler
+
+        injected = {}
+        started = {}
+        handler_latency = []
+        end_to_end = []
+
+        async def mark_start(update, context):
+            started[update.update_id] = time.perf_counter()
+
+        async def mark_done(update, context):
+            now = time.perf_counter()
+            if update.update_id in started:
+                handler_latency.append(now - started.pop(update.update_id))
+            if update.update_id in injected:
+                end_to_end.append(now - injected.pop(update.update_id))
+
+        app = copycat.setup_bot()
+        app.add_handler(TypeHandler(Update, mark_start), group=-100)
+        app.add_handler(TypeHandler(Update, mark_done), group=100)
+
+        copycat.chat_registry.load()
+        await app.initialize()
+        await app.post_init(app)
+        await app.updater.start_polling(poll_interval=0.0, timeout=1)
+        await app.start()
+
+        results = {"config": vars(args)}
+        try:
+            updates = list(synthetic_updates(args, copycat.TRIGGER_KEYWORDS[0]))
+            traffic_started = time.perf_counter()
+            for update in updates:
+                injected[update["update_id"]] = traffic_started
+            api.enqueue(updates)
+            completed = await wait_until(lambda: len(end_to_end) >= len(updates), args.timeout)
+            elapsed = time.perf_counter() - traffic_started
+            results["traffic"] = {
+                "updates": len(updates),
+                "completed": len(end_to_end),
+                "timed_out": not completed,
+                "seconds": round(elapsed, 3),
+                "updates_per_sec": round(len(end_to_end) / elapsed, 1) if elapsed else None,
+                "handler_p50_ms": ms(percentile(handler_latency, 0.50)),
+                "handler_p99_ms": ms(percentile(handler_latency, 0.99)),
+                "end_to_end_p50_ms": ms(percentile(end_to_end, 0.50)),
+                "end_to_end_p99_ms": ms(percentile(end_to_end, 0.99)),
+            }
+
+            if args.broadcast:
+                targets = [BROADCAST_BASE + index for index in range(args.broadcast)]
+                job = copycat.broadcast_jobs.create(OWNER_ID, 1, targets, "users")
+                broadcast_started = time.perf_counter()
+                copycat.broadcast_jobs.start(job)
+                # The job task ends after the completion message to the owner is sent
+                task = copycat.broadcast_jobs._tasks[job.job_id]
+                done, _ = await asyncio.wait([task], timeout=args.timeout)
+                completed = bool(done)
+                elapsed = time.perf_counter() - broadcast_started
+                results["broadcast"] = {
+                    "recipients": args.broadcast,
+                    "sent": job.sent,
+                    "failed": job.failed,
+                    "timed_out": not completed,
+                    "seconds": round(elapsed, 3),
+                    "sends_per_sec": round((job.sent + job.failed) / elapsed, 1) if elapsed else None,
+                }
+        finally:
+            await app.updater.stop()
+            await app.stop()
+            await app.post_stop(app)
+            await app.shutdown()
+            await app.post_shutdown(app)
+            await api.stop()
+
+    results["api_calls"] = dict(sorted(api.calls.items()))
+    results["injected_faults"] = dict(api.faults)
+    return results
+
+
+def print_report(results):
+    traffic = results["traffic"]
+    print(f"Traffic: {traffic['completed']}/{traffic['updates']} updates in {traffic['seconds']}s "
+          f"({traffic['updates_per_sec']} updates/sec){' TIMED OUT' if traffic['timed_out'] else ''}")
+    print(f"  handler latency     p50 {traffic['handler_p50_ms']} ms   p99 {traffic['handler_p99_ms']} ms")
+    print(f"  end-to-end latency  p50 {traffic['end_to_end_p50_ms']} ms   p99 {traffic['end_to_end_p99_ms']} ms")
+    if "broadcast" in results:
+        broadcast = results["broadcast"]
+        print(f"Broadcast: {broadcast['sent']} sent, {broadcast['failed']} failed of {broadcast['recipients']} "
+              f"in {broadcast['seconds']}s ({broadcast['sends_per_sec']}/sec)"
+              f"{' TIMED OUT' if broadcast['timed_out'] else ''}")
+    print("API calls: " + ", ".join(f"{method}={count}" for method, count in results["api_calls"].items()))
+    if results["injected_faults"]:
+        print("Injected faults: " + ", ".join(f"{kind}={count}" for kind, count in results["injected_faults"].items()))
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
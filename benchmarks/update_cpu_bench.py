@@ -0,0 +1,166 @@
+"""Per-update CPU cost of the message handlers.
+
+Feeds a synthetic mix of private text, private media, group chatter,
+group replies to the bot and keyword messages through handle_message.
+The bot is an in-memory one whose API methods return immediately, so
+the measurement is pure handler CPU time (time.process_time), with no
+network or event loop waits. Each kind reports its best pass out of
+--repeat, which filters out noise from the rest of the machine. Run it on
+two trees to compare:
+
+    python benchmarks/update_cpu_bench.py --updates 20000 --json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BOT_ID = 42
+KINDS = ("private_text", "private_photo", "private_sticker", "group_chatter", "group_reply", "group_keyword")
+
+
+class MemoryBot:
+    """Bot stand-in whose API calls complete immediately."""
+
+    id = BOT_ID
+
+    def __init__(self):
+        self.calls = 0
+        self._photo = SimpleNamespace(photo=[SimpleNamespace(file_id="memory-photo")], message_id=2)
+
+    async def _done(self, *args, **kwargs):
+        self.calls += 1
+        return True
+
+    set_message_reaction = send_chat_action = copy_message = _done
+
+    async def send_message(self, *args, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(message_id=1)
+
+    async def edit_message_media(self, *args, **kwargs):
+        self.calls += 1
+        return self._photo
+
+    send_photo = edit_message_media
+
+
+def make_update(kind, index, keyword):
+    from telegram import Update
+
+    user = {"id": 1000 + index % 500, "is_bot": False, "first_name": "User"}
+    if kind.startswith("private"):
+        chat = {"id": user["id"], "type": "private", "first_name": "User"}
+    else:
+        chat = {"id": -1001000000000 - index % 50, "type": "supergroup", "title": "Group"}
+    message = {"message_id": index, "date": 0, "chat": chat, "from": user}
+
+    if kind == "private_photo":
+        message["photo"] = [{"file_id": "p", "file_unique_id": "p", "width": 90, "height": 90}]
+    elif kind == "private_sticker":
+        message["sticker"] = {"file_id": "s", "file_unique_id": "s", "width": 512, "height": 512,
+                              "is_animated": False, "is_video": False, "type": "regular"}
+    elif kind == "group_keyword":
+        message["text"] = f"is that a {keyword}? " + "chatter " * 10
+    elif kind == "group_reply":
+        message["text"] = "replying to you " * 4
+        message["reply_to_message"] = {
+            "message_id": 1, "date": 0, "chat": chat,
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "copycat"}, "text": "hi",
+        }
+    else:
+        message["text"] = f"some ordinary message number {index} " * 3
+    return Update.de_json({"update_id": index, "message": message}, None)
+
+
+async def run(args):
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory(prefix="copycat-cpu-") as workdir:
+        images = os.path.join(workdir, "images")
+        os.makedirs(images)
+        for index in range(32):
+            with open(os.path.join(images, f"{index}.jpg"), "wb") as f:
+                f.write(os.urandom(256))
+        for key, value in {
+            "BOT_TOKEN": "123456:CPU",
+            "LOG_LEVEL": "WARNING",
+            "IMAGE_SOURCES": "local",
+            "LOCAL_IMAGE_DIR": images,
+            "FLOOD_CHAT_BURST": "1000000000",
+            "FLOOD_USER_BURST": "1000000000",
+            "CHAT_ACTION_TTL": "0",
+            "CHAT_DB_PATH": os.path.join(workdir, "chats.db"),
+        }.items():
+            os.environ.setdefault(key, value)
+
+        import copycat
+
+        await copycat.image_sources.start()
+        bot = MemoryBot()
+        context = SimpleNamespace(bot=bot, args=[])
+        keyword = copycat.TRIGGER_KEYWORDS[0]
+        weights = [float(weight) for weight in args.mix.split(",")]
+        kinds = random.choices(KINDS, weights=weights, k=args.updates + args.warmup)
+        updates = [(kind, make_update(kind, index, keyword)) for index, kind in enumerate(kinds, start=1)]
+
+        for _, update in updates[:args.warmup]:
+            await copycat.handle_message(update, context)
+
+        measured = updates[args.warmup:]
+        best_mean = None
+        best_by_kind = {}
+        for _ in range(args.repeat):
+            totals = dict.fromkeys(KINDS, 0.0)
+            counts = dict.fromkeys(KINDS, 0)
+            for kind, update in measured:
+                started = time.process_time()
+                await copycat.handle_message(update, context)
+                totals[kind] += time.process_time() - started
+                counts[kind] += 1
+
+            mean = sum(totals.values()) / len(measured)
+            best_mean = mean if best_mean is None else min(best_mean, mean)
+            for kind in KINDS:
+                if counts[kind]:
+                    cost = totals[kind] / counts[kind]
+                    best_by_kind[kind] = min(best_by_kind.get(kind, cost), cost)
+
+    return {
+        "updates": len(measured),
+        "passes": args.repeat,
+        "bot_calls": bot.calls,
+        "mean_us": round(best_mean * 1e6, 2),
+        "by_kind_us": {kind: round(cost * 1e6, 2) for kind, cost in best_by_kind.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the updates; the best one counts")
+    parser.add_argument("--mix", default="30,5,5,40,10,10", help=f"weights for {', '.join(KINDS)}")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['updates']} updates, best of {results['passes']} passes: "
+          f"mean {results['mean_us']} us CPU per update")
+    for kind, cost in results["by_kind_us"].items():
+        print(f"  {kind:<16} {cost:>8} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,38 @@
 # Ok
+import abc
 import os
 import time
+import uuid
 import random
+import bisect
+import fcntl
+import functools
+import hashlib
+import heapq
+import io
+import json
+import multiprocessing
+import hmac
+import secrets
+import signal
+import sqlite3
+import struct
 import asyncio
+import atexit
 import logging
+import logging.handlers
+import queue
+import re
+import sys
 import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import cProfile
+import pstats
+import tracemalloc
+from array import array
+from collections import OrderedDict, deque
 
 import aiohttp
+from aiohttp import web
 import telegram
 from telegram import (
     Update,
@@ -16,21 +41,154 @@ from telegram import (
     ReactionTypeEmoji,
 )
 from telegram.constants import ChatAction
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     ApplicationBuilder,
+    BaseUpdateProcessor,
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
     Defaults,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
 # Configuration
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
 OWNER_ID = int(os.environ.get("OWNER_ID", "0"))
+# Bot API server; point at a self-hosted server or a local stand-in for load tests
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
 TRIGGER_KEYWORD = "billu"
-WALLHAVEN_API_URL = "https://wallhaven.cc/api/v1/search?q=flower&ratios=16x9&sorting=random&categories=100&purity=100"
+# Default trigger words and aliases; groups can override them with /keywords
+TRIGGER_KEYWORDS = [
+    word.strip().lower()
+    for word in os.environ.get("TRIGGER_KEYWORDS", TRIGGER_KEYWORD).split(",")
+    if word.strip()
+]
+WALLHAVEN_API_URL = os.environ.get(
+    "WALLHAVEN_API_URL",
+    "https://wallhaven.cc/api/v1/search?q=flower&ratios=16x9&sorting=random&categories=100&purity=100",
+)
+
+# Logging configuration
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "color").lower()  # "color" or "json"
+# Per-component sampling for high-volume loggers, e.g. "ECHO=0.1,REACT=0.1,TRACK=0.5"
+LOG_SAMPLE_RATES = os.environ.get("LOG_SAMPLE_RATES", "")
+
+# Image pool configuration
+IMAGE_POOL_SIZE = int(os.environ.get("IMAGE_POOL_SIZE", "96"))
+IMAGE_POOL_LOW_WATER = int(os.environ.get("IMAGE_POOL_LOW_WATER", "24"))
+IMAGE_POOL_TTL = float(os.environ.get("IMAGE_POOL_TTL", "1800"))
+IMAGE_POOL_REFILL_INTERVAL = float(os.environ.get("IMAGE_POOL_REFILL_INTERVAL", "30"))
+IMAGE_POOL_CHAT_HISTORY = int(os.environ.get("IMAGE_POOL_CHAT_HISTORY", "50"))
+IMAGE_POOL_MAX_CHATS = int(os.environ.get("IMAGE_POOL_MAX_CHATS", "10000"))
+
+# Outbound HTTP client configuration
+HTTP_CONNECTOR_LIMIT = int(os.environ.get("HTTP_CONNECTOR_LIMIT", "100"))
+HTTP_LIMIT_PER_HOST = int(os.environ.get("HTTP_LIMIT_PER_HOST", "20"))
+HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "10"))
+
+# Image source backends: comma-separated names with optional weights, e.g. "wallhaven:3,local:1"
+IMAGE_SOURCES = os.environ.get("IMAGE_SOURCES", "wallhaven")
+IMAGE_SOURCE_POLICY = os.environ.get("IMAGE_SOURCE_POLICY", "failover").lower()  # "failover" or "weighted"
+LOCAL_IMAGE_DIR = os.environ.get("LOCAL_IMAGE_DIR", "")
+LOCAL_IMAGE_BATCH = int(os.environ.get("LOCAL_IMAGE_BATCH", "24"))
+
+# Image source circuit breaker configuration
+IMAGE_FETCH_TIMEOUT = float(os.environ.get("IMAGE_FETCH_TIMEOUT", "8"))
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.environ.get("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("BREAKER_SLOW_CALL_SECONDS", "3"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+LAST_GOOD_IMAGES = int(os.environ.get("LAST_GOOD_IMAGES", "200"))
+
+# Telegram file_id cache configuration
+FILE_ID_CACHE_SIZE = int(os.environ.get("FILE_ID_CACHE_SIZE", "5000"))
+FILE_ID_CACHE_PATH = os.environ.get("FILE_ID_CACHE_PATH", "")
+FILE_ID_CACHE_FLUSH_INTERVAL = float(os.environ.get("FILE_ID_CACHE_FLUSH_INTERVAL", "60"))
+CACHE_CHAT_ID = int(os.environ.get("CACHE_CHAT_ID", "0"))
+
+# Broadcast engine configuration
+BROADCAST_WORKERS = int(os.environ.get("BROADCAST_WORKERS", "8"))
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", "30"))
+BROADCAST_GROUP_RATE = float(os.environ.get("BROADCAST_GROUP_RATE", "20"))  # per minute
+# Per-group buckets kept; a bucket refills within 60/BROADCAST_GROUP_RATE seconds, so at
+# BROADCAST_RATE sends/s far fewer than this are ever partly drained
+BROADCAST_GROUP_MAX_KEYS = int(os.environ.get("BROADCAST_GROUP_MAX_KEYS", "1024"))
+BROADCAST_MAX_RETRIES = int(os.environ.get("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_PROGRESS_INTERVAL = float(os.environ.get("BROADCAST_PROGRESS_INTERVAL", "3"))
+BROADCAST_JOBS_DIR = os.environ.get("BROADCAST_JOBS_DIR", "broadcast_jobs")
+# Job control across processes: how often runners check for requests, how long senders wait
+BROADCAST_CONTROL_POLL = float(os.environ.get("BROADCAST_CONTROL_POLL", "1"))
+BROADCAST_CONTROL_TIMEOUT = float(os.environ.get("BROADCAST_CONTROL_TIMEOUT", "15"))
+# How often to pick up running jobs no process holds, e.g. ones a removed worker left behind
+BROADCAST_ADOPT_INTERVAL = float(os.environ.get("BROADCAST_ADOPT_INTERVAL", "10"))
+
+# Chat registry configuration
+CHAT_DB_PATH = os.environ.get("CHAT_DB_PATH", "chats.db")
+CHAT_REGISTRY_FLUSH_INTERVAL = float(os.environ.get("CHAT_REGISTRY_FLUSH_INTERVAL", "5"))
+# Binary copy of the chat ID sets written on clean shutdown; empty disables it
+CHAT_SNAPSHOT_PATH = os.environ.get("CHAT_SNAPSHOT_PATH", f"{CHAT_DB_PATH}.ids")
+# Recent adds/removals kept in small sets before being merged into the sorted arrays
+CHAT_ID_BUFFER = int(os.environ.get("CHAT_ID_BUFFER", "4096"))
+
+# Per-user state: entries expire after a TTL and the least recently used go first at the cap
+BUTTON_STATE_MAX_USERS = int(os.environ.get("BUTTON_STATE_MAX_USERS", "10000"))
+BUTTON_STATE_TTL = float(os.environ.get("BUTTON_STATE_TTL", "3600"))
+BROADCAST_MODE_MAX_USERS = int(os.environ.get("BROADCAST_MODE_MAX_USERS", "16"))
+BROADCAST_MODE_TTL = float(os.environ.get("BROADCAST_MODE_TTL", "600"))
+
+# Flood control for image triggers (keyword and /start)
+FLOOD_CHAT_BURST = int(os.environ.get("FLOOD_CHAT_BURST", "5"))
+FLOOD_CHAT_RATE = float(os.environ.get("FLOOD_CHAT_RATE", "10"))  # per minute
+FLOOD_USER_BURST = int(os.environ.get("FLOOD_USER_BURST", "3"))
+FLOOD_USER_RATE = float(os.environ.get("FLOOD_USER_RATE", "4"))  # per minute
+FLOOD_MAX_KEYS = int(os.environ.get("FLOOD_MAX_KEYS", "10000"))
+FLOOD_THROTTLED_ACTION = os.environ.get("FLOOD_THROTTLED_ACTION", "react").lower()  # "react" or "silent"
+
+# Update processing configuration - different chats run in parallel, each chat stays in order
+UPDATE_CONCURRENCY = int(os.environ.get("UPDATE_CONCURRENCY", "32"))
+# Cap on updates running or waiting for their chat; UPDATE_CONCURRENCY bounds the running ones
+UPDATE_MAX_PENDING = int(os.environ.get("UPDATE_MAX_PENDING", "4096"))
+
+# Chat action configuration - Telegram shows an action for about 5 seconds
+CHAT_ACTION_TTL = float(os.environ.get("CHAT_ACTION_TTL", "4.5"))
+CHAT_ACTION_MAX_CHATS = int(os.environ.get("CHAT_ACTION_MAX_CHATS", "10000"))
+BROADCAST_CHAT_ACTIONS = os.environ.get("BROADCAST_CHAT_ACTIONS", "").lower() in ("1", "true", "yes")
+
+# Webhook configuration - setting WEBHOOK_URL switches from polling to webhook mode
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = "/" + os.environ.get("WEBHOOK_PATH", "telegram").strip("/")
+# Telegram echoes this in every webhook request; without one set, each start generates its own
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "") or secrets.token_urlsafe(32)
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Health and readiness configuration
+READY_API_MAX_AGE = float(os.environ.get("READY_API_MAX_AGE", "120"))
+READY_API_PROBE_INTERVAL = float(os.environ.get("READY_API_PROBE_INTERVAL", "30"))
+READY_MAX_LOOP_LAG = float(os.environ.get("READY_MAX_LOOP_LAG", "1.0"))
+READY_MAX_QUEUE_DEPTH = int(os.environ.get("READY_MAX_QUEUE_DEPTH", "1000"))
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", "0.5"))
+
+# Multi-worker mode: a front process routes updates to WORKERS processes by chat
+WORKERS = int(os.environ.get("WORKERS", "1"))
+WORKER_VNODES = int(os.environ.get("WORKER_VNODES", "64"))
+WORKER_STOP_TIMEOUT = float(os.environ.get("WORKER_STOP_TIMEOUT", "30"))
+# Lock file electing the one worker that refills the image pool and pre-warms the cache chat
+WORKER_LEADER_LOCK = os.environ.get("WORKER_LEADER_LOCK", f"{CHAT_DB_PATH}.leader")
+WORKER_LEADER_POLL = float(os.environ.get("WORKER_LEADER_POLL", "10"))
+
+# Owner profiling configuration
+PROFILE_DEFAULT_SECONDS = float(os.environ.get("PROFILE_DEFAULT_SECONDS", "30"))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "300"))
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "40"))
+TRACEMALLOC_FRAMES = int(os.environ.get("TRACEMALLOC_FRAMES", "1"))
 
 
 # Welcome Messages Dictionary
@@ -88,6 +246,7 @@ ERROR_MESSAGES = {
 # Status Messages
 STATUS_MESSAGES = {
     "broadcast_cancelled": "❌ Broadcast cancelled.",
+    "broadcast_progress": "📢 Broadcasting to {total} {target}...\n✅ Sent: {sent}\n⚠️ Failed: {failed}\n⚡ {rate:.1f} msg/s",
     "pinging": "🛰️ Pinging...",
     "server_alive": "Sakura bot is alive!"
 }
@@ -165,19 +324,76 @@ class ColoredFormatter(logging.Formatter):
             
         return log_format
 
-# Configure logging with custom formatter
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line for log shippers."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread."""
+
+    DEFERRABLE_TYPES = (str, int, float, type(None))
+
+    def prepare(self, record):
+        # The stock prepare() formats on the caller's thread. A record whose message and
+        # args are immutable scalars formats the same later, so it is handed over as-is;
+        # anything else (e.g. a library logging a mutable object) is formatted now.
+        args = record.args
+        if (isinstance(record.msg, str) and not record.exc_info
+                and (not args or (isinstance(args, tuple)
+                                  and all(isinstance(arg, self.DEFERRABLE_TYPES) for arg in args)))):
+            return record
+        return super().prepare(record)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of INFO/DEBUG records; warnings and errors always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def parse_sample_rates(spec):
+    """Parse "NAME=rate,NAME=rate" into a dict of logger name to rate."""
+    rates = {}
+    for item in spec.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            try:
+                rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+            except ValueError:
+                pass
+    return rates
+
+
+# Configure logging: handlers only enqueue, a listener thread formats and writes
+log_queue = queue.SimpleQueue()
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else ColoredFormatter())
+log_listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logging.basicConfig(
-    level=logging.INFO,
-    format='%(message)s',  # We'll handle formatting in ColoredFormatter
-    handlers=[
-        logging.StreamHandler()
-    ]
+    level=getattr(logging, LOG_LEVEL, logging.INFO),
+    format='%(message)s',  # Records DeferredQueueHandler formats early get the listener's formatting too
+    handlers=[DeferredQueueHandler(log_queue)]
 )
 
-# Apply custom formatter to all handlers
-for handler in logging.root.handlers:
-    handler.setFormatter(ColoredFormatter())
-
 logger = logging.getLogger(__name__)
 
 # Create separate loggers for different components with clean names
@@ -189,48 +405,445 @@ loggers = {
     'api': logging.getLogger('API'),
     'chat_action': logging.getLogger('ACTION'),
     'tracking': logging.getLogger('TRACK'),
+    'pool': logging.getLogger('POOL'),
+    'http': logging.getLogger('HTTP'),
+    'file_id': logging.getLogger('FILEID'),
+    'webhook': logging.getLogger('WEBHOOK'),
+    'health': logging.getLogger('HEALTH'),
     'commands': logging.getLogger('CMD'),
+    'profile': logging.getLogger('PROFILE'),
+    'workers': logging.getLogger('WORKER'),
     'errors': logging.getLogger('ERROR')
 }
 
-# Apply formatter to all component loggers
-for component_logger in loggers.values():
-    for handler in component_logger.handlers:
-        handler.setFormatter(ColoredFormatter())
+# Sample high-volume component loggers
+for logger_name, rate in parse_sample_rates(LOG_SAMPLE_RATES).items():
+    if rate < 1.0:
+        logging.getLogger(logger_name).addFilter(SamplingFilter(rate))
 
 # Disable telegram library's debug logs to keep terminal clean
 logging.getLogger('telegram').setLevel(logging.WARNING)
 logging.getLogger('httpx').setLevel(logging.WARNING)
 logging.getLogger('httpcore').setLevel(logging.WARNING)
 
+def _unique(sorted_ids):
+    """Drop repeats from an ascending stream of ids."""
+    previous = None
+    for chat_id in sorted_ids:
+        if chat_id != previous:
+            yield chat_id
+            previous = chat_id
+
+
+def _difference(sorted_ids, excluded):
+    """Yield ids from an ascending stream that are missing from the ascending stream excluded."""
+    excluded = iter(excluded)
+    skip = next(excluded, None)
+    for chat_id in sorted_ids:
+        while skip is not None and skip < chat_id:
+            skip = next(excluded, None)
+        if chat_id != skip:
+            yield chat_id
+
+
+class ChatIdSet:
+    """Set of chat ids stored as a sorted int64 array plus small buffers of recent changes."""
+
+    __slots__ = ("_base", "_added", "_removed", "compact_min")
+
+    def __init__(self, ids=(), compact_min=CHAT_ID_BUFFER):
+        self._base = array("q")
+        # Invariants: _added is disjoint from _base, _removed is a subset of it
+        self._added = set()
+        self._removed = set()
+        self.compact_min = compact_min
+        self.update(ids)
+
+    def _in_base(self, chat_id):
+        index = bisect.bisect_left(self._base, chat_id)
+        return index < len(self._base) and self._base[index] == chat_id
+
+    def __contains__(self, chat_id):
+        if chat_id in self._added:
+            return True
+        if chat_id in self._removed:
+            return False
+        return self._in_base(chat_id)
+
+    def __len__(self):
+        return len(self._base) - len(self._removed) + len(self._added)
+
+    def __iter__(self):
+        """Yield ids in ascending order without copying the array."""
+        base, removed = self._base, self._removed
+        if not self._added and not removed:
+            return iter(base)
+        merged = heapq.merge(base, sorted(self._added))
+        return (chat_id for chat_id in merged if chat_id not in removed) if removed else merged
+
+    def __sizeof__(self):
+        return (object.__sizeof__(self) + sys.getsizeof(self._base)
+                + sys.getsizeof(self._added) + sys.getsizeof(self._removed))
+
+    def add(self, chat_id):
+        if chat_id in self._added:
+            return
+        if chat_id in self._removed:
+            self._removed.discard(chat_id)
+        elif not self._in_base(chat_id):
+            self._added.add(chat_id)
+            self._maybe_compact()
+
+    def discard(self, chat_id):
+        if chat_id in self._added:
+            self._added.discard(chat_id)
+        elif chat_id not in self._removed and self._in_base(chat_id):
+            self._removed.add(chat_id)
+            self._maybe_compact()
+
+    def update(self, ids):
+        ids = sorted(set(ids))
+        if len(ids) <= self.compact_min:
+            for chat_id in ids:
+                self.add(chat_id)
+            return
+        # Bulk loads go straight into the array rather than through the buffers
+        self._base = array("q", _unique(heapq.merge(self, ids)) if len(self) else ids)
+        self._added = set()
+        self._removed = set()
+
+    def load_sorted(self, ids):
+        """Replace the contents with ids that are already ascending and unique, e.g. from ORDER BY."""
+        self._base = array("q", ids)
+        self._added = set()
+        self._removed = set()
+
+    def clear(self):
+        self._base = array("q")
+        self._added = set()
+        self._removed = set()
+
+    def union(self, *others):
+        """Yield the ids in this set or any of others, ascending, by merging rather than copying."""
+        return _unique(heapq.merge(self, *others))
+
+    def difference(self, other):
+        """Yield the ids in this set but not in other, ascending."""
+        return _difference(self, other)
+
+    def count_common(self, other):
+        """Number of ids in both sets, without building the intersection."""
+        smaller, larger = (self, other) if len(self) <= len(other) else (other, self)
+        return sum(1 for chat_id in smaller if chat_id in larger)
+
+    def _maybe_compact(self):
+        if len(self._added) + len(self._removed) > max(self.compact_min, len(self._base) >> 4):
+            self.compact()
+
+    def compact(self):
+        """Merge the buffered changes into a new sorted array."""
+        if self._added or self._removed:
+            # A new array rather than in-place edits, so running iterators keep a consistent view
+            self._base = array("q", iter(self))
+            self._added = set()
+            self._removed = set()
+
+    def write_to(self, f):
+        """Write the ids as a little-endian count followed by the raw int64 array."""
+        self.compact()
+        base = self._base
+        if sys.byteorder != "little":
+            base = array("q", base)
+            base.byteswap()
+        f.write(struct.pack("<q", len(base)))
+        base.tofile(f)
+
+    def read_from(self, f):
+        """Replace the contents with ids written by write_to."""
+        (count,) = struct.unpack("<q", f.read(8))
+        base = array("q")
+        base.fromfile(f, count)
+        if sys.byteorder != "little":
+            base.byteswap()
+        self._base = base
+        self._added = set()
+        self._removed = set()
+
+
+class _StateEntry:
+    __slots__ = ("value", "expires")
+
+    def __init__(self, value, expires):
+        self.value = value
+        self.expires = expires
+
+
+class UserStateStore:
+    """Per-user state with a size cap, TTL expiry and least-recently-used eviction."""
+
+    def __init__(self, name, max_entries, ttl):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = {"expired": 0, "lru": 0}
+        self._entries = OrderedDict()
+        self._next_sweep = time.monotonic() + ttl
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self._entries)
+
+    def _evict(self, key, reason):
+        del self._entries[key]
+        self.evictions[reason] += 1
+        metrics.inc("user_state_evictions_total", labels=(("store", self.name), ("reason", reason)))
+
+    def _live(self, key):
+        """Return the entry for key if it has not expired, marking it recently used."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self._evict(key, "expired")
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def __contains__(self, key):
+        return self._live(key) is not None
+
+    def __getitem__(self, key):
+        entry = self._live(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry.value
+
+    def get(self, key, default=None):
+        entry = self._live(key)
+        return default if entry is None else entry.value
+
+    def __setitem__(self, key, value):
+        now = time.monotonic()
+        self._entries[key] = _StateEntry(value, now + self.ttl)
+        self._entries.move_to_end(key)
+        if now >= self._next_sweep:
+            self.sweep(now)
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)), "lru")
+
+    def pop(self, key, *default):
+        entry = self._live(key)
+        if entry is None:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        del self._entries[key]
+        return entry.value
+
+    def sweep(self, now=None):
+        """Drop every expired entry; runs at most once per TTL from __setitem__."""
+        now = time.monotonic() if now is None else now
+        for key in [key for key, entry in self._entries.items() if entry.expires <= now]:
+            self._evict(key, "expired")
+        self._next_sweep = now + self.ttl
+
+
 # Bot state storage
-user_button_state = {}
-user_ids = set()
-group_ids = set()
-broadcast_mode = {}
+user_button_state = UserStateStore("button_state", BUTTON_STATE_MAX_USERS, BUTTON_STATE_TTL)
+user_ids = ChatIdSet()
+group_ids = ChatIdSet()
+dead_chat_ids = ChatIdSet()
+# Broadcast target picked by the owner, waiting for the message to send
+broadcast_mode = UserStateStore("broadcast_mode", BROADCAST_MODE_MAX_USERS, BROADCAST_MODE_TTL)
 
 
-async def send_chat_action(context, chat_id, action):
-    """Send chat action without delay."""
+class Metrics:
+    """Minimal Prometheus-style counters, gauges and histograms kept in plain dicts."""
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, prefix="copycat"):
+        self.prefix = prefix
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def describe(self, name, metric_type, help_text):
+        self._help[name] = (metric_type, help_text)
+
+    def inc(self, name, value=1, labels=()):
+        """Increment a counter; labels is a tuple of (key, value) pairs."""
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=(), buckets=DEFAULT_BUCKETS):
+        """Record a histogram observation."""
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+        index = bisect.bisect_left(histogram[0], value)
+        if index < len(histogram[1]):
+            histogram[1][index] += 1
+        histogram[2] += value
+        histogram[3] += 1
+
+    def gauge(self, name, func):
+        """Register a callable returning {labels: value} evaluated at scrape time."""
+        self._gauges[name] = func
+
+    def counter_value(self, name, labels=()):
+        return self._counters.get((name, labels), 0)
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = tuple(labels) + tuple(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        by_name = {}
+        for (name, labels), value in self._counters.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        for name in sorted(set(self._help) | set(by_name) | {n for n, _ in self._histograms} | set(self._gauges)):
+            full_name = f"{self.prefix}_{name}"
+            metric_type, help_text = self._help.get(name, ("untyped", ""))
+            if help_text:
+                lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+
+            for labels, value in by_name.get(name, ()):
+                lines.append(f"{full_name}{self._format_labels(labels)} {value}")
+
+            for (hist_name, labels), (buckets, counts, total, count) in self._histograms.items():
+                if hist_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{full_name}_bucket{self._format_labels(labels, (('le', bound),))} {cumulative}")
+                lines.append(f"{full_name}_bucket{self._format_labels(labels, (('le', '+Inf'),))} {count}")
+                lines.append(f"{full_name}_sum{self._format_labels(labels)} {total}")
+                lines.append(f"{full_name}_count{self._format_labels(labels)} {count}")
+
+            if name in self._gauges:
+                try:
+                    for labels, value in self._gauges[name]().items():
+                        lines.append(f"{full_name}{self._format_labels(labels)} {value}")
+                except Exception as e:
+                    loggers['errors'].error(f"Error collecting gauge {name}: {str(e)[:50]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("handler_calls_total", "counter", "Handler invocations.")
+metrics.describe("handler_latency_seconds", "histogram", "Handler latency in seconds.")
+metrics.describe("bot_api_calls_total", "counter", "Bot API calls by method.")
+metrics.describe("bot_api_errors_total", "counter", "Bot API errors by method and telegram.error class.")
+metrics.describe("image_fetch_total", "counter", "Image source fetches by result.")
+metrics.describe("image_fetch_latency_seconds", "histogram", "Image source fetch latency in seconds.")
+metrics.describe("image_degraded_total", "counter", "Greetings served from the last-known-good image cache.")
+metrics.describe("tracked_chats", "gauge", "Tracked chats by type and liveness.")
+metrics.describe("user_state_entries", "gauge", "Entries held in each per-user state store.")
+metrics.describe("user_state_evictions_total", "counter", "Per-user state entries dropped, by store and reason.")
+metrics.gauge("user_state_entries", lambda: {
+    (("store", store.name),): len(store) for store in (user_button_state, broadcast_mode)
+})
+
+
+def instrumented(name):
+    """Decorator recording call count and latency for an async handler."""
+    labels = (("handler", name),)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                metrics.inc("handler_calls_total", labels=labels)
+                metrics.observe("handler_latency_seconds", time.perf_counter() - started, labels=labels)
+        return wrapper
+    return decorator
+
+
+class ChatActionScheduler:
+    """Suppresses chat actions that would not change what the chat already shows."""
+
+    def __init__(self, ttl=CHAT_ACTION_TTL, max_chats=CHAT_ACTION_MAX_CHATS):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self._visible = {}
+
+    def _purge(self, now):
+        self._visible = {chat_id: entry for chat_id, entry in self._visible.items() if entry[1] > now}
+
+    def should_send(self, chat_id, action):
+        """Return True and mark the action visible, or False if it is redundant."""
+        now = time.monotonic()
+        current = self._visible.get(chat_id)
+        if current and current[1] > now:
+            # Same action still showing, or typing while a richer action is showing
+            if current[0] == action or action == ChatAction.TYPING:
+                metrics.inc("chat_actions_total", labels=(("result", "suppressed"),))
+                return False
+
+        if len(self._visible) >= self.max_chats:
+            self._purge(now)
+        self._visible[chat_id] = (action, now + self.ttl)
+        metrics.inc("chat_actions_total", labels=(("result", "sent"),))
+        return True
+
+    def forget(self, chat_id):
+        """Drop the visible entry after a failed send so the next attempt goes out."""
+        self._visible.pop(chat_id, None)
+
+
+chat_actions = ChatActionScheduler()
+metrics.describe("chat_actions_total", "counter", "Chat actions sent or suppressed as redundant.")
+
+
+async def send_bot_chat_action(bot, chat_id, action):
+    """Send chat action without delay unless an equivalent one is still visible."""
+    if not chat_actions.should_send(chat_id, action):
+        loggers['chat_action'].debug("Suppressed '%s' for chat %s", action, chat_id)
+        return
     try:
-        loggers['chat_action'].debug(f"Sending '{action}' to chat {chat_id}")
-        await context.bot.send_chat_action(chat_id=chat_id, action=action)
-        loggers['chat_action'].debug(f"Action '{action}' sent successfully")
+        loggers['chat_action'].debug("Sending '%s' to chat %s", action, chat_id)
+        await bot.send_chat_action(chat_id=chat_id, action=action)
+        loggers['chat_action'].debug("Action '%s' sent successfully", action)
     except telegram.error.Forbidden:
+        chat_actions.forget(chat_id)
         loggers['errors'].warning(f"Forbidden to send action to chat {chat_id}")
     except telegram.error.BadRequest as e:
+        chat_actions.forget(chat_id)
         loggers['errors'].warning(f"Bad request for chat {chat_id}: {str(e)[:50]}")
     except telegram.error.NetworkError:
+        chat_actions.forget(chat_id)
         loggers['errors'].warning(f"Network error for chat {chat_id}")
     except Exception as e:
+        chat_actions.forget(chat_id)
         loggers['errors'].error(f"Unexpected error sending action: {str(e)[:50]}")
 
 
+async def send_chat_action(context, chat_id, action):
+    """Send chat action for a handler context."""
+    await send_bot_chat_action(context.bot, chat_id, action)
+
+
 def get_random_emoji():
     """Get a random soft emoji."""
     try:
         emoji = random.choice(SOFT_EMOJIS)
-        logger.debug(f"Selected emoji: {emoji}")
+        logger.debug("Selected emoji: %s", emoji)
         return emoji
     except Exception:
         loggers['errors'].error("Error selecting random emoji, using fallback")
@@ -241,7 +854,7 @@ def get_random_reaction():
     """Get a random reaction emoji."""
     try:
         reaction = random.choice(REACTION_EMOJIS)
-        logger.debug(f"Selected reaction: {reaction}")
+        logger.debug("Selected reaction: %s", reaction)
         return reaction
     except Exception:
         loggers['errors'].error("Error selecting random reaction, using fallback")
@@ -258,302 +871,2724 @@ def create_user_mention(user):
         name = f"{user.first_name or ''} {user.last_name or ''}".strip()
         if not name:
             name = "User"
-            logger.debug(f"User {user.id} has no name, using fallback")
+            logger.debug("User %s has no name, using fallback", user.id)
         
         mention = f"<a href='tg://user?id={user.id}'>{name}</a>"
-        logger.debug(f"Created mention for user {user.id}")
+        logger.debug("Created mention for user %s", user.id)
         return mention
     except Exception as e:
         loggers['errors'].error(f"Error creating user mention: {str(e)[:50]}")
         return "Unknown User"
 
 
-async def fetch_image():
-    """Fetch a random image from Wallhaven API."""
-    try:
-        loggers['api'].info("Fetching image from Wallhaven API")
-        async with aiohttp.ClientSession() as session:
-            async with session.get(WALLHAVEN_API_URL) as response:
+class HttpClient:
+    """Long-lived aiohttp session shared by all outbound image-source traffic."""
+
+    def __init__(self, limit=HTTP_CONNECTOR_LIMIT, limit_per_host=HTTP_LIMIT_PER_HOST,
+                 dns_cache_ttl=HTTP_DNS_CACHE_TTL, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                 connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._session = None
+        self._host_stats = {}
+
+    def _host(self, host):
+        stats = self._host_stats.get(host)
+        if stats is None:
+            stats = self._host_stats[host] = {
+                "requests": 0,
+                "errors": 0,
+                "new_connections": 0,
+                "reused_connections": 0,
+                "dns_cache_hits": 0,
+            }
+        return stats
+
+    async def _on_request_start(self, session, ctx, params):
+        ctx.host = params.url.host
+        self._host(ctx.host)["requests"] += 1
+
+    async def _on_request_exception(self, session, ctx, params):
+        self._host(params.url.host)["errors"] += 1
+
+    async def _on_connection_create_end(self, session, ctx, params):
+        self._host(getattr(ctx, "host", None))["new_connections"] += 1
+
+    async def _on_connection_reuseconn(self, session, ctx, params):
+        self._host(getattr(ctx, "host", None))["reused_connections"] += 1
+
+    async def _on_dns_cache_hit(self, session, ctx, params):
+        self._host(params.host)["dns_cache_hits"] += 1
+
+    def _trace_config(self):
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(self._on_dns_cache_hit)
+        return trace_config
+
+    async def start(self):
+        """Create the shared session if it does not exist yet."""
+        if self._session is not None and not self._session.closed:
+            return self._session
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[self._trace_config()],
+        )
+        loggers['http'].info("HTTP session created (limit %s, per host %s)", self.limit, self.limit_per_host)
+        return self._session
+
+    async def get_session(self):
+        """Return the shared session, creating it lazily if needed."""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def close(self):
+        """Close the shared session and its pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            loggers['http'].info("HTTP session closed - %s", self.stats())
+        self._session = None
+
+    def stats(self):
+        """Return a snapshot of per-host connection statistics."""
+        return {host: dict(stats) for host, stats in self._host_stats.items()}
+
+
+http_client = HttpClient()
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker tripped by the failure rate over recent calls."""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, name, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 failure_rate=BREAKER_FAILURE_RATE, slow_call_seconds=BREAKER_SLOW_CALL_SECONDS,
+                 open_seconds=BREAKER_OPEN_SECONDS):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.short_circuited = 0
+        self._outcomes = deque(maxlen=window)
+        self._probing = False
+
+    def allow(self):
+        """Return True if a call may go through now; only one probe runs while half-open."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.short_circuited += 1
+                return False
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                self.short_circuited += 1
+                return False
+            self._probing = True
+        return True
+
+    def record(self, success, latency):
+        """Record a call outcome; calls slower than slow_call_seconds count as failures."""
+        failed = not success or latency >= self.slow_call_seconds
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+            if failed:
+                self._open()
+            else:
+                self._outcomes.clear()
+                self._transition(self.CLOSED)
+            return
+
+        self._outcomes.append(failed)
+        if self.state == self.CLOSED and len(self._outcomes) >= self.min_calls:
+            if sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def release(self):
+        """Give up a half-open probe slot without an outcome, e.g. when the call was cancelled."""
+        self._probing = False
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self._transition(self.OPEN)
+
+    def _transition(self, state):
+        if state != self.state:
+            loggers['api'].warning("%s circuit %s -> %s", self.name, self.state, state)
+            metrics.inc("circuit_transitions_total", labels=(("breaker", self.name), ("state", state)))
+            self.state = state
+
+
+metrics.describe("circuit_transitions_total", "counter", "Circuit breaker state changes.")
+metrics.describe("circuit_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open).")
+
+
+class ImageSource(abc.ABC):
+    """Base class for image backends; fetch() returns a batch of image references."""
+
+    name = "source"
+
+    def __init__(self, weight=1.0):
+        self.weight = weight
+        self.breaker = CircuitBreaker(self.name)
+
+    async def start(self):
+        """Prepare the backend before the pool first fills."""
+
+    @abc.abstractmethod
+    async def fetch(self):
+        """Return a batch of image references, or an empty list."""
+
+    def owns(self, ref):
+        """Return True if ref was produced by this backend."""
+        return False
+
+    async def media(self, ref):
+        """Return what to pass to send_photo for ref."""
+        return ref
+
+
+class WallhavenSource(ImageSource):
+    """Random images from a Wallhaven search query."""
+
+    name = "wallhaven"
+
+    def __init__(self, weight=1.0, api_url=WALLHAVEN_API_URL):
+        super().__init__(weight)
+        self.api_url = api_url
+
+    async def fetch(self):
+        try:
+            loggers['api'].info("Fetching image from Wallhaven API")
+            session = await http_client.get_session()
+            async with session.get(self.api_url) as response:
                 if response.status != 200:
                     loggers['api'].error(f"API returned status {response.status}")
-                    return None
+                    return []
 
                 data = await response.json()
                 images = data.get("data", [])
 
                 if not images:
                     loggers['api'].warning("No images found in API response")
-                    return None
+                    return []
 
-                selected_image = random.choice(images)["path"]
-                loggers['api'].info("Successfully fetched image")
-                return selected_image
-    except aiohttp.ClientError:
-        loggers['api'].error("Network error fetching image")
-    except asyncio.TimeoutError:
-        loggers['api'].error("Timeout error fetching image")
-    except KeyError:
-        loggers['api'].error("Invalid API response structure")
-    except Exception as e:
-        loggers['api'].error(f"Unexpected error: {str(e)[:50]}")
-    return None
+                urls = [image["path"] for image in images]
+                loggers['api'].info("Successfully fetched %s images", len(urls))
+                return urls
+        except aiohttp.ClientError:
+            loggers['api'].error("Network error fetching image")
+        except asyncio.TimeoutError:
+            loggers['api'].error("Timeout error fetching image")
+        except KeyError:
+            loggers['api'].error("Invalid API response structure")
+        except Exception as e:
+            loggers['api'].error(f"Unexpected error: {str(e)[:50]}")
+        return []
 
 
-def get_message_type_and_action(message):
-    """Determine message type and corresponding chat action."""
-    for msg_type, action in MESSAGE_TYPE_ACTIONS.items():
-        if msg_type == 'text':
-            continue
-        if getattr(message, msg_type, None):
-            return msg_type, action
-    return 'text', MESSAGE_TYPE_ACTIONS['text']
+class LocalDirectorySource(ImageSource):
+    """Pre-downloaded images from a directory, uploaded as multipart attachments."""
 
+    name = "local"
+    PREFIX = "local:"
+    EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
 
-async def send_image(chat_id, user, bot, loading_msg=None, reply_to_message_id=None):
-    """Send a welcome image with a personalized message."""
-    try:
-        loggers['image'].info(f"Starting image send for chat {chat_id}")
-        
-        # Show upload photo action
+    def __init__(self, weight=1.0, path=LOCAL_IMAGE_DIR, batch_size=LOCAL_IMAGE_BATCH):
+        super().__init__(weight)
+        self.path = path
+        self.batch_size = batch_size
+        self._files = {}
+        self._refs = []
+
+    def __len__(self):
+        return len(self._refs)
+
+    def load(self):
+        """Index every non-empty image file under the directory."""
+        files = {}
+        if not self.path or not os.path.isdir(self.path):
+            loggers['image'].warning("Local image directory %r not found", self.path)
+        else:
+            for root, _, names in os.walk(self.path):
+                for filename in names:
+                    if not filename.lower().endswith(self.EXTENSIONS):
+                        continue
+                    full_path = os.path.join(root, filename)
+                    try:
+                        if os.path.getsize(full_path) > 0:
+                            files[self.PREFIX + os.path.relpath(full_path, self.path)] = full_path
+                    except OSError:
+                        continue
+        self._files = files
+        self._refs = list(files)
+        loggers['image'].info("Indexed %s local images from %s", len(self._refs), self.path)
+
+    async def start(self):
+        await asyncio.to_thread(self.load)
+
+    async def fetch(self):
+        if not self._refs:
+            return []
+        return random.sample(self._refs, min(self.batch_size, len(self._refs)))
+
+    def owns(self, ref):
+        return ref.startswith(self.PREFIX)
+
+    @staticmethod
+    def _read(path):
+        with open(path, "rb") as handle:
+            return handle.read()
+
+    async def media(self, ref):
+        path = self._files.get(ref)
+        if path is None:
+            raise telegram.error.BadRequest(f"Unknown local image {ref}")
+        data = await asyncio.to_thread(self._read, path)
+        # attach=True gives the file an attach:// URI, which InputMediaPhoto (edit_message_media) needs
+        return telegram.InputFile(data, filename=os.path.basename(path), attach=True)
+
+
+IMAGE_SOURCE_TYPES = {
+    WallhavenSource.name: WallhavenSource,
+    LocalDirectorySource.name: LocalDirectorySource,
+}
+
+
+def parse_image_sources(spec):
+    """Parse "wallhaven:3,local:1" into backend instances; weights default to 1."""
+    sources = []
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition(":")
+        if not name:
+            continue
+        source_type = IMAGE_SOURCE_TYPES.get(name.lower())
+        if source_type is None:
+            loggers['errors'].error(f"Unknown image source {name!r} ignored")
+            continue
         try:
-            await bot.send_chat_action(chat_id=chat_id, action=ChatAction.UPLOAD_PHOTO)
-        except Exception:
-            loggers['image'].debug("Failed to send upload photo action")
-        
-        image_url = await fetch_image()
+            sources.append(source_type(weight=float(weight) if weight else 1.0))
+        except ValueError:
+            loggers['errors'].error(f"Invalid weight for image source {name!r} ignored")
+            sources.append(source_type())
+    return sources or [WallhavenSource()]
 
-        if not image_url:
-            error_msg = ERROR_MESSAGES["image_fetch_failed"]
-            loggers['image'].warning("No image URL available")
-            
+
+class ImageSourceRouter:
+    """Choose between image backends by failover order or weighted mix."""
+
+    def __init__(self, sources, policy=IMAGE_SOURCE_POLICY):
+        self.sources = sources
+        self.policy = policy
+
+    async def start(self):
+        for source in self.sources:
             try:
-                if loading_msg:
-                    await loading_msg.edit_text(error_msg)
-                else:
-                    await bot.send_message(chat_id=chat_id, text=error_msg)
-                loggers['image'].info("Sent error message")
+                await source.start()
             except Exception as e:
-                loggers['errors'].error(f"Failed to send error message: {str(e)[:50]}")
-            return
+                loggers['errors'].error(f"Error starting image source {source.name}: {str(e)[:50]}")
 
-        mention = create_user_mention(user)
-        greeting = random.choice(WELCOME_MESSAGES).format(mention=mention)
+    def _order(self):
+        """Failover tries sources in configured order; weighted picks the first by weight."""
+        if self.policy != "weighted" or len(self.sources) < 2:
+            return self.sources
+        remaining = list(self.sources)
+        first = random.choices(remaining, weights=[source.weight for source in remaining])[0]
+        remaining.remove(first)
+        return [first] + remaining
 
-        try:
-            if loading_msg:
-                await bot.edit_message_media(
-                    chat_id=chat_id,
-                    message_id=loading_msg.message_id,
-                    media=telegram.InputMediaPhoto(
-                        media=image_url,
-                        caption=greeting,
-                        parse_mode="HTML"
-                    )
-                )
-                loggers['image'].info("Successfully updated loading message with image")
-            else:
-                await bot.send_photo(
-                    chat_id=chat_id,
-                    photo=image_url,
-                    caption=greeting,
-                    reply_to_message_id=reply_to_message_id,
-                    parse_mode="HTML"
-                )
-                loggers['image'].info("Successfully sent new image")
-        except telegram.error.BadRequest:
-            loggers['image'].warning("Bad request sending image, trying fallback")
-            # Try sending text fallback
-            try:
-                fallback_msg = f"{greeting}\n\n{ERROR_MESSAGES['image_fetch_failed']}"
-                if loading_msg:
-                    await loading_msg.edit_text(fallback_msg, parse_mode="HTML")
-                else:
-                    await bot.send_message(chat_id=chat_id, text=fallback_msg, parse_mode="HTML")
-                loggers['image'].info("Sent fallback text message")
-            except Exception:
-                loggers['errors'].error("Fallback message also failed")
-        except telegram.error.Forbidden:
-            loggers['errors'].warning(f"Forbidden to send image to chat {chat_id}")
-        except telegram.error.NetworkError:
-            loggers['errors'].warning(f"Network error sending image to chat {chat_id}")
-        except Exception as e:
-            loggers['errors'].error(f"Unexpected error sending image: {str(e)[:50]}")
-    except Exception as e:
-        loggers['errors'].critical(f"Critical error in send_image: {str(e)[:50]}")
-        raise
+    async def fetch_batch(self):
+        """Fetch from the chosen backend, falling through to the others when it yields nothing."""
+        for source in self._order():
+            urls = await fetch_from_source(source)
+            if urls:
+                return urls
+        return []
+
+    async def media(self, ref):
+        for source in self.sources:
+            if source.owns(ref):
+                return await source.media(ref)
+        return ref
 
 
-async def react_to_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """React to a message based on chat type and content."""
+async def fetch_from_source(source):
+    """Fetch one batch from a backend through its circuit breaker, recording metrics."""
+    labels = (("source", source.name),)
+    if not source.breaker.allow():
+        metrics.inc("image_fetch_total", labels=labels + (("result", "short_circuit"),))
+        return []
+
+    started = time.perf_counter()
+    urls = None
     try:
-        message = update.message
-        if not message:
-            return
+        urls = await asyncio.wait_for(source.fetch(), timeout=IMAGE_FETCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        loggers['api'].error("Image fetch from %s exceeded %ss", source.name, IMAGE_FETCH_TIMEOUT)
+        urls = []
+    except Exception as e:
+        loggers['errors'].error(f"Image fetch from {source.name} failed: {str(e)[:50]}")
+        urls = []
+    finally:
+        # Always settle the breaker, or a half-open probe would never end
+        if urls is None:
+            source.breaker.release()
+    latency = time.perf_counter() - started
+    source.breaker.record(bool(urls), latency)
+    metrics.observe("image_fetch_latency_seconds", latency, labels=labels)
+    metrics.inc("image_fetch_total", labels=labels + (("result", "success" if urls else "failure"),))
+    return urls
 
-        chat_type = message.chat.type
-        bot = context.bot
-        emoji = get_random_reaction()
-        lowered = (message.text or "").lower()
-        user_id = message.from_user.id if message.from_user else None
 
-        should_react = False
+image_sources = ImageSourceRouter(parse_image_sources(IMAGE_SOURCES))
+metrics.gauge("circuit_state", lambda: {
+    (("breaker", source.name),): (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN).index(source.breaker.state)
+    for source in image_sources.sources
+})
 
-        # Always react in private chats
-        if chat_type == "private":
-            should_react = True
-            loggers['reaction'].debug("Private chat - will react")
-        # In groups, react if keyword is mentioned or replying to bot
-        elif chat_type in ["group", "supergroup"]:
-            if TRIGGER_KEYWORD in lowered:
-                should_react = True
-                loggers['reaction'].debug(f"Keyword '{TRIGGER_KEYWORD}' found - will react")
-            elif message.reply_to_message and message.reply_to_message.from_user.id == bot.id:
-                should_react = True
-                loggers['reaction'].debug("Reply to bot - will react")
+
+async def fetch_image_batch():
+    """Fetch a batch of random image references from the configured backends."""
+    return await image_sources.fetch_batch()
+
+
+BURST_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+metrics.describe("image_fetch_requests_total", "counter", "Live image fetch requests by whether they led or joined a fetch.")
+metrics.describe("image_fetch_burst_size", "histogram", "Callers served by a single upstream image fetch.")
+metrics.describe("image_fetch_dedup_ratio", "gauge", "Share of live image fetch requests served without their own upstream fetch.")
+
+
+class ImageFetchCoalescer:
+    """Single-flight live image fetches: concurrent callers share one upstream request."""
+
+    def __init__(self):
+        self.requests = 0
+        self.flights = 0
+        self._flight = None
+
+    def dedup_ratio(self):
+        if not self.requests:
+            return 0.0
+        return 1 - self.flights / self.requests
+
+    def _land(self, flight):
+        if self._flight is flight:
+            self._flight = None
+        metrics.observe("image_fetch_burst_size", flight["joined"], buckets=BURST_SIZE_BUCKETS)
+
+    async def fetch(self, chat_id=None):
+        """Return a URL from the shared batch that no other waiter received, or None."""
+        self.requests += 1
+        flight = self._flight
+        if flight is None:
+            self.flights += 1
+            flight = self._flight = {"task": asyncio.create_task(fetch_image_batch()), "urls": None, "joined": 0, "waiters": 0}
+            flight["task"].add_done_callback(lambda _: self._land(flight))
+            metrics.inc("image_fetch_requests_total", labels=(("path", "leader"),))
+        else:
+            metrics.inc("image_fetch_requests_total", labels=(("path", "coalesced"),))
+        flight["joined"] += 1
+        flight["waiters"] += 1
+
+        try:
+            # Shielded so a cancelled waiter does not abort the fetch for everyone else
+            urls = await asyncio.shield(flight["task"])
+        finally:
+            flight["waiters"] -= 1
+
+        if flight["urls"] is None:
+            flight["urls"] = list(urls)
+            random.shuffle(flight["urls"])
+        remaining = flight["urls"]
+        selected = remaining.pop() if remaining else None
+
+        # The last waiter hands the unclaimed rest of the batch to the pool
+        if not flight["waiters"] and remaining:
+            image_pool.add(remaining)
+            remaining.clear()
+
+        if selected is None and urls:
+            # The burst outnumbered the batch; anything left over is in the pool by now
+            return image_pool.take(chat_id)
+        if selected:
+            image_pool.remember(chat_id, selected)
+        return selected
+
+
+image_fetches = ImageFetchCoalescer()
+metrics.gauge("image_fetch_dedup_ratio", lambda: {(): round(image_fetches.dedup_ratio(), 4)})
+
+
+async def fetch_image(chat_id=None):
+    """Fetch a random image live, keeping the rest of the batch in the pool."""
+    return await image_fetches.fetch(chat_id)
+
+
+def get_photo_file_id(message):
+    """Return the file_id of the largest photo size in a sent message."""
+    photos = getattr(message, "photo", None)
+    if not photos:
+        return None
+    return photos[-1].file_id
+
+
+class FileIdCache:
+    """LRU map of image URL to Telegram file_id, optionally persisted to disk."""
+
+    def __init__(self, size=FILE_ID_CACHE_SIZE, path=FILE_ID_CACHE_PATH,
+                 flush_interval=FILE_ID_CACHE_FLUSH_INTERVAL, cache_chat_id=CACHE_CHAT_ID):
+        self.size = size
+        self.path = path
+        self.flush_interval = flush_interval
+        self.cache_chat_id = cache_chat_id
+        self.bot = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._dirty = False
+        self._prewarm_queue = deque()
+        self._prewarm_needed = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        # Off in workers other than the leader, so only one process uploads to the cache chat
+        self.prewarming = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def backlog(self):
+        """URLs queued for pre-warming that have not been uploaded yet."""
+        return len(self._prewarm_queue)
+
+    def get(self, url):
+        """Return the cached file_id for a URL, or None."""
+        file_id = self._entries.get(url)
+        if file_id is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(url)
+        self.hits += 1
+        return file_id
+
+    def put(self, url, file_id):
+        """Cache a file_id for a URL, evicting the least recently used entry."""
+        if not url or not file_id:
+            return
+        self._entries[url] = file_id
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def store(self, url, message):
+        """Cache the file_id Telegram returned for a sent photo message."""
+        self.put(url, get_photo_file_id(message))
+
+    def last_good(self, exclude=()):
+        """Pick one of the most recently used URLs, preferring ones not in exclude."""
+        recent = []
+        for url in reversed(self._entries):
+            recent.append(url)
+            if len(recent) >= LAST_GOOD_IMAGES:
+                break
+        if not recent:
+            return None
+        fresh = [url for url in recent if url not in exclude]
+        return random.choice(fresh or recent)
+
+    def discard(self, url):
+        """Drop a URL whose file_id Telegram no longer accepts."""
+        if self._entries.pop(url, None) is not None:
+            self._dirty = True
+
+    def load(self):
+        """Load persisted entries from disk, if persistence is enabled."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for url, file_id in data.items():
+                self.put(url, file_id)
+            self._dirty = False
+            loggers['file_id'].info("Loaded %s cached file_ids", len(self._entries))
+        except (OSError, ValueError, AttributeError) as e:
+            loggers['errors'].error(f"Failed to load file_id cache: {str(e)[:50]}")
+
+    def save(self):
+        """Persist entries to disk atomically, if persistence is enabled and changed."""
+        if not self.path or not self._dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(dict(self._entries), f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            loggers['file_id'].debug("Saved %s cached file_ids", len(self._entries))
+        except OSError as e:
+            loggers['errors'].error(f"Failed to save file_id cache: {str(e)[:50]}")
+
+    def schedule_prewarm(self, urls):
+        """Queue URLs to be uploaded to the cache chat ahead of use."""
+        if not self.cache_chat_id or not self.prewarming:
+            return
+        for url in urls:
+            if url not in self._entries:
+                self._prewarm_queue.append(url)
+        if self._prewarm_queue:
+            self._prewarm_needed.set()
+
+    async def prewarm(self):
+        """Upload queued URLs to the private cache chat and record their file_ids."""
+        while self._prewarm_queue and self.bot:
+            url = self._prewarm_queue.popleft()
+            if url in self._entries:
+                continue
+            try:
+                message = await self.bot.send_photo(
+                    chat_id=self.cache_chat_id,
+                    photo=await image_sources.media(url),
+                    disable_notification=True
+                )
+                self.store(url, message)
+            except telegram.error.RetryAfter as e:
+                self._prewarm_queue.appendleft(url)
+                await asyncio.sleep(get_retry_after(e))
+            except telegram.error.BadRequest:
+                loggers['file_id'].debug("Bad request pre-warming image, dropping it from the pool")
+                image_pool.discard(url)
+            except Exception as e:
+                loggers['errors'].error(f"Error pre-warming image: {str(e)[:50]}")
+
+    async def run(self):
+        """Pre-warm queued images and flush to disk until stopped."""
+        while not self._stopping:
+            try:
+                await self.prewarm()
+                self.save()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                loggers['errors'].error(f"Error in file_id cache loop: {str(e)[:50]}")
+
+            self._prewarm_needed.clear()
+            try:
+                await asyncio.wait_for(self._prewarm_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, bot):
+        """Load persisted entries and start the background pre-warm/flush task."""
+        self.bot = bot
+        self.load()
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._prewarm_needed = asyncio.Event()
+            if self._prewarm_queue:
+                self._prewarm_needed.set()
+            self._task = asyncio.create_task(self.run())
+            loggers['file_id'].info(f"file_id cache started (size {self.size}, cache chat {self.cache_chat_id or 'off'})")
+
+    async def stop(self):
+        """Cancel the background task and persist the cache."""
+        if self._task:
+            self._stopping = True
+            self._prewarm_needed.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.save()
+
+
+file_id_cache = FileIdCache()
+
+
+class ImagePool:
+    """Bounded pool of prefetched image URLs kept warm by a background task."""
+
+    def __init__(self, size=IMAGE_POOL_SIZE, low_water=IMAGE_POOL_LOW_WATER, ttl=IMAGE_POOL_TTL,
+                 refill_interval=IMAGE_POOL_REFILL_INTERVAL, chat_history=IMAGE_POOL_CHAT_HISTORY,
+                 max_chats=IMAGE_POOL_MAX_CHATS):
+        self.size = size
+        self.low_water = min(low_water, size)
+        self.ttl = ttl
+        self.refill_interval = refill_interval
+        self.chat_history = chat_history
+        self.max_chats = max_chats
+        self._entries = deque()
+        self._urls = set()
+        self._recent = OrderedDict()
+        self._refill_needed = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expire(self):
+        """Drop URLs older than the configured TTL."""
+        cutoff = time.monotonic() - self.ttl
+        while self._entries and self._entries[0][1] < cutoff:
+            url, _ = self._entries.popleft()
+            self._urls.discard(url)
+
+    def add(self, urls):
+        """Add fresh URLs to the pool, skipping duplicates and respecting the size cap."""
+        now = time.monotonic()
+        added = 0
+        new_urls = []
+        for url in urls:
+            if len(self._entries) >= self.size:
+                break
+            if url in self._urls:
+                continue
+            self._entries.append((url, now))
+            self._urls.add(url)
+            added += 1
+            new_urls.append(url)
+        file_id_cache.schedule_prewarm(new_urls)
+        return added
+
+    def discard(self, url):
+        """Remove a URL from the pool, e.g. after Telegram rejected it."""
+        if url in self._urls:
+            self._urls.discard(url)
+            self._entries = deque(entry for entry in self._entries if entry[0] != url)
+
+    def remember(self, chat_id, url):
+        """Record that a URL was served to a chat."""
+        if chat_id is None:
+            return
+        history = self._recent.get(chat_id)
+        if history is None:
+            history = self._recent[chat_id] = deque(maxlen=self.chat_history)
+            if len(self._recent) > self.max_chats:
+                self._recent.popitem(last=False)
+        else:
+            self._recent.move_to_end(chat_id)
+        history.append(url)
+
+    def seen(self, chat_id):
+        """Return the URLs recently served to a chat."""
+        return self._recent.get(chat_id, ())
+
+    def take(self, chat_id=None):
+        """Take a URL this chat has not seen recently, or None if the pool has none."""
+        self._expire()
+        seen = self._recent.get(chat_id, ())
+        selected = None
+        for entry in self._entries:
+            if entry[0] not in seen:
+                selected = entry
+                break
+
+        if selected:
+            self._entries.remove(selected)
+            self._urls.discard(selected[0])
+            self.remember(chat_id, selected[0])
+
+        if len(self._entries) < self.low_water:
+            self._refill_needed.set()
+        return selected[0] if selected else None
+
+    async def refill(self):
+        """Fetch batches until the pool is full or the source stops yielding new URLs."""
+        self._expire()
+        while len(self._entries) < self.size:
+            urls = await fetch_image_batch()
+            if not urls or not self.add(urls):
+                break
+        loggers['pool'].debug("Image pool holds %s URLs", len(self._entries))
+
+    async def run(self):
+        """Keep the pool above its low-water mark until stopped."""
+        while not self._stopping:
+            try:
+                await self.refill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                loggers['errors'].error(f"Error refilling image pool: {str(e)[:50]}")
+
+            self._refill_needed.clear()
+            try:
+                await asyncio.wait_for(self._refill_needed.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Start the background refill task."""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._refill_needed = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+            loggers['pool'].info("Image pool refill started (size %s, low water %s)", self.size, self.low_water)
+
+    async def stop(self):
+        """Cancel the background refill task."""
+        if self._task:
+            self._stopping = True
+            self._refill_needed.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+image_pool = ImagePool()
+metrics.describe("image_pool_size", "gauge", "Prefetched image URLs ready to serve.")
+metrics.gauge("image_pool_size", lambda: {(): len(image_pool)})
+metrics.describe("file_id_cache_lookups_total", "counter", "file_id cache lookups by result.")
+metrics.gauge("file_id_cache_lookups_total", lambda: {
+    (("result", "hit"),): file_id_cache.hits,
+    (("result", "miss"),): file_id_cache.misses,
+})
+
+
+def get_retry_after(error):
+    """Return the RetryAfter delay in seconds, whether given as int or timedelta."""
+    retry_after = error.retry_after
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+# Entries of MESSAGE_TYPE_ACTIONS that are actual Message attachments, in priority order
+MEDIA_TYPE_ACTIONS = tuple(
+    (msg_type, action) for msg_type, action in MESSAGE_TYPE_ACTIONS.items()
+    if msg_type != 'text' and hasattr(telegram.Message, msg_type)
+)
+
+
+def get_message_type_and_action(message):
+    """Determine message type and corresponding chat action."""
+    # A message with text carries no attachment, so skip probing for one
+    if message.text is not None:
+        return 'text', MESSAGE_TYPE_ACTIONS['text']
+    for msg_type, action in MEDIA_TYPE_ACTIONS:
+        if getattr(message, msg_type, None):
+            return msg_type, action
+    return 'text', MESSAGE_TYPE_ACTIONS['text']
+
+
+async def deliver_photo(bot, chat_id, media, caption, loading_msg=None, reply_to_message_id=None):
+    """Send a photo by URL or file_id, replacing the loading message when given."""
+    if loading_msg:
+        sent = await bot.edit_message_media(
+            chat_id=chat_id,
+            message_id=loading_msg.message_id,
+            media=telegram.InputMediaPhoto(
+                media=media,
+                caption=caption,
+                parse_mode="HTML"
+            )
+        )
+        loggers['image'].info("Successfully updated loading message with image")
+    else:
+        sent = await bot.send_photo(
+            chat_id=chat_id,
+            photo=media,
+            caption=caption,
+            reply_to_message_id=reply_to_message_id,
+            parse_mode="HTML"
+        )
+        loggers['image'].info("Successfully sent new image")
+    return sent
+
+
+# BadRequest messages that mean a cached file_id is no longer usable
+FILE_ID_BAD_REQUESTS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file reference expired",
+    "file_reference_expired",
+    "wrong type of the file",
+    "can't use file of type",
+)
+
+
+def is_file_id_error(error):
+    """Return True if a BadRequest was caused by the file_id itself rather than the chat or caption."""
+    text = str(error).lower()
+    return any(reason in text for reason in FILE_ID_BAD_REQUESTS)
+
+
+async def send_image(chat_id, user, bot, loading_msg=None, reply_to_message_id=None):
+    """Send a welcome image with a personalized message."""
+    try:
+        loggers['image'].info("Starting image send for chat %s", chat_id)
+        
+        # Show upload photo action
+        await send_bot_chat_action(bot, chat_id, ChatAction.UPLOAD_PHOTO)
+        
+        image_url = image_pool.take(chat_id)
+        if image_url:
+            loggers['image'].debug("Serving pooled image (%s left)", len(image_pool))
+        else:
+            image_url = await fetch_image(chat_id)
+
+        if not image_url:
+            # Degraded mode: reuse a recently delivered image whose file_id is cached
+            image_url = file_id_cache.last_good(image_pool.seen(chat_id))
+            if image_url:
+                metrics.inc("image_degraded_total")
+                image_pool.remember(chat_id, image_url)
+                loggers['image'].info("Image sources unavailable, serving last-known-good image")
+
+        if not image_url:
+            error_msg = ERROR_MESSAGES["image_fetch_failed"]
+            loggers['image'].warning("No image URL available")
+            
+            try:
+                if loading_msg:
+                    await loading_msg.edit_text(error_msg)
+                else:
+                    await bot.send_message(chat_id=chat_id, text=error_msg)
+                loggers['image'].info("Sent error message")
+            except Exception as e:
+                loggers['errors'].error(f"Failed to send error message: {str(e)[:50]}")
+            return
+
+        mention = create_user_mention(user)
+        greeting = random.choice(WELCOME_MESSAGES).format(mention=mention)
+
+        try:
+            file_id = file_id_cache.get(image_url)
+            if file_id:
+                try:
+                    await deliver_photo(bot, chat_id, file_id, greeting, loading_msg, reply_to_message_id)
+                    loggers['image'].debug("Sent image by cached file_id")
+                except telegram.error.BadRequest as e:
+                    if not is_file_id_error(e):
+                        raise
+                    loggers['image'].warning("Cached file_id rejected, resending by URL")
+                    file_id_cache.discard(image_url)
+                    file_id = None
+
+            if not file_id:
+                sent = await deliver_photo(bot, chat_id, await image_sources.media(image_url), greeting, loading_msg, reply_to_message_id)
+                file_id_cache.store(image_url, sent)
+        except telegram.error.BadRequest:
+            loggers['image'].warning("Bad request sending image, trying fallback")
+            # Try sending text fallback
+            try:
+                fallback_msg = f"{greeting}\n\n{ERROR_MESSAGES['image_fetch_failed']}"
+                if loading_msg:
+                    await loading_msg.edit_text(fallback_msg, parse_mode="HTML")
+                else:
+                    await bot.send_message(chat_id=chat_id, text=fallback_msg, parse_mode="HTML")
+                loggers['image'].info("Sent fallback text message")
+            except Exception:
+                loggers['errors'].error("Fallback message also failed")
+        except telegram.error.Forbidden:
+            loggers['errors'].warning(f"Forbidden to send image to chat {chat_id}")
+        except telegram.error.NetworkError:
+            loggers['errors'].warning(f"Network error sending image to chat {chat_id}")
+        except Exception as e:
+            loggers['errors'].error(f"Unexpected error sending image: {str(e)[:50]}")
+    except Exception as e:
+        loggers['errors'].critical(f"Critical error in send_image: {str(e)[:50]}")
+        raise
+
+
+class TriggerMatcher:
+    """Case-insensitive Aho-Corasick automaton that finds all keywords in one pass."""
+
+    PREFILTER_MAX_KEYWORDS = 4
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        goto = [{}]
+        output = [0]
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto.append({})
+                    output.append(0)
+                    goto[state][char] = next_state
+                state = next_state
+            output[state] |= 1 << keyword_id
+
+        # Breadth-first pass turning the trie into a full transition table
+        alphabet = {char for keyword in self.keywords for char in keyword}
+        fail = [0] * len(goto)
+        delta = [dict() for _ in goto]
+        queue_ = deque()
+        for char in alphabet:
+            state = goto[0].get(char, 0)
+            delta[0][char] = state
+            if state:
+                queue_.append(state)
+        while queue_:
+            state = queue_.popleft()
+            output[state] |= output[fail[state]]
+            for char in alphabet:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    delta[state][char] = delta[fail[state]][char]
+                else:
+                    fail[next_state] = delta[fail[state]][char]
+                    delta[state][char] = next_state
+                    queue_.append(next_state)
+
+        # Map upper-case input onto the same transitions so text never needs lowering
+        for transitions in delta:
+            for char, next_state in list(transitions.items()):
+                transitions.setdefault(char.upper(), next_state)
+            for char in [char for char, next_state in transitions.items() if not next_state]:
+                del transitions[char]
+        self._delta = delta
+        self._output = output
+        # Most messages contain no keyword; cheap C-level checks reject those before the
+        # per-character walk below. They only gate the scan, never decide hits. The regex
+        # alternation costs time per keyword, so it is only used for a handful of them;
+        # past that, the gate is whether the text contains any keyword's first letter.
+        self._prefilter = re.compile(
+            "|".join(re.escape(keyword) for keyword in sorted(self.keywords, key=len, reverse=True)),
+            re.IGNORECASE
+        ) if 0 < len(self.keywords) <= self.PREFILTER_MAX_KEYWORDS else None
+        first_chars = {keyword[0] for keyword in self.keywords if keyword}
+        self._first_chars = frozenset(first_chars | {char.upper() for char in first_chars})
+
+    def scan(self, text):
+        """Return a bitmask of the keyword ids found in text."""
+        if self._prefilter is not None:
+            if not self._prefilter.search(text):
+                return 0
+        elif self._first_chars.isdisjoint(text):
+            return 0
+        delta = self._delta
+        output = self._output
+        state = 0
+        hits = 0
+        for char in text:
+            state = delta[state].get(char, 0)
+            hits |= output[state]
+        return hits
+
+
+class TriggerEngine:
+    """Keyword triggers with per-chat overrides stored as bitmasks over one matcher."""
+
+    def __init__(self, default_keywords=TRIGGER_KEYWORDS):
+        self.default_keywords = frozenset(default_keywords)
+        self.chat_keywords = {}
+        self._build()
+
+    def _build(self):
+        keywords = set(self.default_keywords)
+        for chat_keywords in self.chat_keywords.values():
+            keywords.update(chat_keywords)
+        self.matcher = TriggerMatcher(sorted(keywords))
+        ids = {keyword: index for index, keyword in enumerate(self.matcher.keywords)}
+        self.default_mask = self._mask(self.default_keywords, ids)
+        self._chat_masks = {
+            chat_id: self._mask(chat_keywords, ids)
+            for chat_id, chat_keywords in self.chat_keywords.items()
+        }
+        loggers['tracking'].debug(
+            "Trigger matcher built with %s keywords, %s chat overrides",
+            len(ids), len(self._chat_masks)
+        )
+
+    @staticmethod
+    def _mask(keywords, ids):
+        mask = 0
+        for keyword in keywords:
+            mask |= 1 << ids[keyword]
+        return mask
+
+    def match(self, text, chat_id=None):
+        """Return the keywords enabled for this chat that appear in text."""
+        if not text:
+            return ()
+        hits = self.matcher.scan(text) & self._chat_masks.get(chat_id, self.default_mask)
+        if not hits:
+            return ()
+        return tuple(
+            keyword for index, keyword in enumerate(self.matcher.keywords)
+            if hits >> index & 1
+        )
+
+    def keywords_for(self, chat_id):
+        return self.chat_keywords.get(chat_id, self.default_keywords)
+
+    def load(self, overrides):
+        """Replace all per-chat overrides and rebuild once."""
+        self.chat_keywords = {chat_id: frozenset(keywords) for chat_id, keywords in overrides.items()}
+        self._build()
+
+    def set_chat_keywords(self, chat_id, keywords):
+        """Override a chat's keywords, or restore the defaults when keywords is None."""
+        if keywords is None:
+            self.chat_keywords.pop(chat_id, None)
+        else:
+            self.chat_keywords[chat_id] = frozenset(keyword.lower() for keyword in keywords)
+        self._build()
+
+
+trigger_engine = TriggerEngine()
+
+
+GROUP_CHAT_TYPES = ("group", "supergroup")
+
+
+class UpdateInfo:
+    """What the message handlers need to know about an update, computed once per update."""
+
+    __slots__ = ("chat_id", "chat_type", "is_private", "is_group", "user_id", "text",
+                 "triggers", "reply_to_bot", "message_type", "chat_action")
+
+    def __init__(self, chat_id, chat_type, user_id, text, triggers, reply_to_bot, message_type, chat_action):
+        self.chat_id = chat_id
+        self.chat_type = chat_type
+        self.is_private = chat_type == "private"
+        self.is_group = chat_type in GROUP_CHAT_TYPES
+        self.user_id = user_id
+        self.text = text
+        self.triggers = triggers
+        self.reply_to_bot = reply_to_bot
+        self.message_type = message_type
+        self.chat_action = chat_action
+
+
+def classify_update(update, bot_id):
+    """Classify a message update in one pass; None if the update carries no message."""
+    message = update.message
+    if not message:
+        return None
+    chat = message.chat
+    user = message.from_user
+    text = message.text or ""
+    reply = message.reply_to_message
+    reply_user = reply.from_user if reply else None
+    message_type, chat_action = get_message_type_and_action(message)
+    return UpdateInfo(
+        chat.id,
+        chat.type,
+        user.id if user else None,
+        text,
+        trigger_engine.match(text, chat.id),
+        reply_user is not None and reply_user.id == bot_id,
+        message_type,
+        chat_action,
+    )
+
+
+async def react_to_message(update: Update, context: ContextTypes.DEFAULT_TYPE, info=None):
+    """React to a message based on chat type and content.
+
+    ``info`` is the update's UpdateInfo when the caller has already classified it.
+    """
+    try:
+        message = update.message
+        if not message:
+            return
+
+        bot = context.bot
+        if info is None:
+            info = classify_update(update, bot.id)
+        emoji = get_random_reaction()
+
+        should_react = False
+
+        # Always react in private chats
+        if info.is_private:
+            should_react = True
+            loggers['reaction'].debug("Private chat - will react")
+        # In groups, react if keyword is mentioned or replying to bot
+        elif info.is_group:
+            if info.triggers:
+                should_react = True
+                loggers['reaction'].debug("Keyword found - will react")
+            elif info.reply_to_bot:
+                should_react = True
+                loggers['reaction'].debug("Reply to bot - will react")
 
         if should_react:
             try:
                 await bot.set_message_reaction(
-                    chat_id=message.chat.id,
+                    chat_id=info.chat_id,
                     message_id=message.message_id,
                     reaction=[ReactionTypeEmoji(emoji=emoji)]
                 )
-                loggers['reaction'].info(f"Reacted with {emoji} in chat {message.chat.id}")
+                loggers['reaction'].info("Reacted with %s in chat %s", emoji, info.chat_id)
             except telegram.error.BadRequest:
                 loggers['reaction'].debug("Bad request setting reaction")
             except telegram.error.Forbidden:
-                loggers['reaction'].debug(f"Forbidden to react in chat {message.chat.id}")
+                loggers['reaction'].debug("Forbidden to react in chat %s", info.chat_id)
             except Exception as e:
                 loggers['errors'].error(f"Unexpected error setting reaction: {str(e)[:50]}")
     except Exception as e:
         loggers['errors'].critical(f"Critical error in react_to_message: {str(e)[:50]}")
 
 
-def track_chat_id(chat_id, chat_type):
-    """Track user and group IDs."""
-    try:
-        if chat_type == "private":
-            if chat_id not in user_ids:
-                user_ids.add(chat_id)
-                loggers['tracking'].info(f"New user tracked: {chat_id} (Total: {len(user_ids)})")
-        elif chat_type in ["group", "supergroup"]:
-            if chat_id not in group_ids:
-                group_ids.add(chat_id)
-                loggers['tracking'].info(f"New group tracked: {chat_id} (Total: {len(group_ids)})")
-    except Exception as e:
-        loggers['errors'].error(f"Error tracking chat ID {chat_id}: {str(e)[:50]}")
+# BadRequest messages that mean the chat is gone for good
+PERMANENT_BAD_REQUESTS = (
+    "chat not found",
+    "group chat was deactivated",
+    "peer_id_invalid",
+)
 
 
-async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /start command."""
-    try:
-        user_id = update.effective_user.id if update.effective_user else None
-        loggers['commands'].info(f"/start from user {user_id}")
-        
-        await react_to_message(update, context)
-        user = update.effective_user
-        chat_id = update.effective_chat.id
+def classify_send_error(error):
+    """Return (failure kind, permanent) for an error raised while sending to a chat."""
+    if isinstance(error, telegram.error.Forbidden):
+        return "forbidden", True
+    if isinstance(error, telegram.error.ChatMigrated):
+        return "migrated", True
+    if isinstance(error, telegram.error.BadRequest):
+        text = str(error).lower()
+        if any(reason in text for reason in PERMANENT_BAD_REQUESTS):
+            return "chat_not_found", True
+        return "bad_request", False
+    if isinstance(error, telegram.error.RetryAfter):
+        return "flood", False
+    if isinstance(error, telegram.error.NetworkError):
+        return "network", False
+    return "unknown", False
 
-        if not user:
-            loggers['errors'].error("No user found in /start command")
-            return
 
-        # Initialize user state
-        user_button_state[user.id] = {"updates": False, "group": False, "addme": False}
+class ChatRegistry:
+    """SQLite-backed store of known chats with write-behind batching."""
 
-        # Track chat ID
-        track_chat_id(chat_id, update.effective_chat.type)
+    SNAPSHOT_MAGIC = b"CCCHATS1"
 
-        # Send typing action before responding
-        await send_chat_action(context, chat_id, ChatAction.TYPING)
-        
-        # Send loading message and then welcome image
-        emoji_msg = get_random_emoji()
+    def __init__(self, path=CHAT_DB_PATH, flush_interval=CHAT_REGISTRY_FLUSH_INTERVAL,
+                 snapshot_path=CHAT_SNAPSHOT_PATH):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.snapshot_path = snapshot_path
+        self.loaded = False
+        # Generation of the snapshot the sets came from, until the first write makes it stale
+        self._snapshot_generation = None
+        # Set in worker processes, where other workers write to the same database
+        self.shared = False
+        self._conn = None
+        # The connection is shared by the to_thread calls below, which may overlap
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._seen = {}
+        self._failures = {}
+        self._task = None
+        self._stopping = False
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            conn = self._conn
+            # Workers open the same database together; IMMEDIATE makes one of them do the
+            # schema work while the others wait (up to the connection timeout) and see the result
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS chats ("
+                    "chat_id INTEGER PRIMARY KEY, "
+                    "chat_type TEXT NOT NULL, "
+                    "first_seen REAL NOT NULL, "
+                    "last_seen REAL, "
+                    "dead INTEGER NOT NULL DEFAULT 0, "
+                    "failure TEXT, "
+                    "failed_at REAL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS chat_keywords ("
+                    "chat_id INTEGER PRIMARY KEY, "
+                    "keywords TEXT NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS registry_meta ("
+                    "key TEXT PRIMARY KEY, "
+                    "value INTEGER NOT NULL)"
+                )
+                # Databases created before these columns existed
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(chats)")}
+                for column, definition in (
+                    ("last_seen", "REAL"),
+                    ("dead", "INTEGER NOT NULL DEFAULT 0"),
+                    ("failure", "TEXT"),
+                    ("failed_at", "REAL"),
+                ):
+                    if column not in columns:
+                        conn.execute(f"ALTER TABLE chats ADD COLUMN {column} {definition}")
+            except sqlite3.Error:
+                conn.rollback()
+                conn.close()
+                self._conn = None
+                raise
+            conn.commit()
+        return self._conn
+
+    def load(self):
+        """Bulk-load every known chat into the in-memory ID sets."""
+        with self._lock:
+            if self.loaded:
+                return
+            started = time.perf_counter()
+            source = "snapshot"
+            if not self._load_snapshot():
+                source = "database"
+                try:
+                    conn = self._connect()
+                    # chat_id is the primary key, so each query streams out already sorted
+                    for ids, condition in ((user_ids, "chat_type = 'private'"),
+                                           (group_ids, "chat_type != 'private'"),
+                                           (dead_chat_ids, "dead")):
+                        ids.load_sorted(row[0] for row in conn.execute(
+                            f"SELECT chat_id FROM chats WHERE {condition} ORDER BY chat_id"
+                        ))
+                except sqlite3.Error as e:
+                    loggers['errors'].error(f"Failed to load chat registry: {str(e)[:50]}")
+                    return
+            try:
+                overrides = self._connect().execute("SELECT chat_id, keywords FROM chat_keywords").fetchall()
+                trigger_engine.load({chat_id: json.loads(keywords) for chat_id, keywords in overrides})
+            except (sqlite3.Error, ValueError) as e:
+                loggers['errors'].error(f"Failed to load chat keywords: {str(e)[:50]}")
+            self.loaded = True
+            elapsed = (time.perf_counter() - started) * 1000
+            loggers['tracking'].info(
+                f"Chat registry loaded {len(user_ids)} users and {len(group_ids)} groups "
+                f"({len(dead_chat_ids)} dead) from {source} in {elapsed:.1f}ms"
+            )
+
+    def _snapshot_marker(self):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM registry_meta WHERE key = 'snapshot_generation'"
+            ).fetchone()
+            return row[0] if row else None
+
+    def _load_snapshot(self):
+        """Fill the ID sets from the snapshot if the database has not changed since it was written."""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
         try:
-            loading_msg = await context.bot.send_message(chat_id=chat_id, text=emoji_msg)
-        except Exception as e:
-            loggers['errors'].error(f"Failed to send loading message: {str(e)[:50]}")
+            expected = self._snapshot_marker()
+            if expected is None:
+                return False
+            with open(self.snapshot_path, "rb") as f:
+                magic, generation = struct.unpack("<8sq", f.read(16))
+                if magic != self.SNAPSHOT_MAGIC or generation != expected:
+                    return False
+                for ids in (user_ids, group_ids, dead_chat_ids):
+                    ids.read_from(f)
+        except (OSError, EOFError, struct.error, sqlite3.Error) as e:
+            loggers['errors'].error(f"Failed to load chat snapshot: {str(e)[:50]}")
+            for ids in (user_ids, group_ids, dead_chat_ids):
+                ids.clear()
+            return False
+        self._snapshot_generation = generation
+        return True
+
+    def _save_snapshot(self):
+        """Write the ID sets to the snapshot and mark it as matching the database."""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM registry_meta WHERE key = 'snapshot_generation'")
+            generation = time.time_ns()
+            tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(struct.pack("<8sq", self.SNAPSHOT_MAGIC, generation))
+                for ids in (user_ids, group_ids, dead_chat_ids):
+                    ids.write_to(f)
+            os.replace(tmp_path, self.snapshot_path)
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO registry_meta (key, value) VALUES ('snapshot_generation', ?)",
+                    (generation,)
+                )
+            self._snapshot_generation = generation
+
+    def _read_chats(self):
+        with self._lock:
+            return self._connect().execute("SELECT chat_id, chat_type, dead FROM chats").fetchall()
+
+    async def sync(self):
+        """Pick up chats other workers wrote to the shared database; no-op in single-process mode."""
+        if not self.shared:
+            return
+        await self.flush()
+        try:
+            rows = await asyncio.to_thread(self._read_chats)
+        except sqlite3.Error as e:
+            loggers['errors'].error(f"Failed to sync chat registry: {str(e)[:50]}")
             return
+        user_ids.update(chat_id for chat_id, chat_type, _ in rows if chat_type == "private")
+        group_ids.update(chat_id for chat_id, chat_type, _ in rows if chat_type != "private")
+        # Our own changes were just flushed, so the database is authoritative for liveness
+        dead_chat_ids.clear()
+        dead_chat_ids.update(chat_id for chat_id, _, dead in rows if dead)
+
+    def record(self, chat_id, chat_type):
+        """Buffer a newly seen chat for the next flush."""
+        self._pending[chat_id] = (chat_type, time.time())
+
+    def touch(self, chat_id):
+        """Note activity from a chat, reviving it if it was marked dead."""
+        self._seen[chat_id] = time.time()
+        self._failures.pop(chat_id, None)
+        if chat_id in dead_chat_ids:
+            dead_chat_ids.discard(chat_id)
+            loggers['tracking'].info("Chat %s is live again", chat_id)
+
+    def record_failure(self, chat_id, error):
+        """Record why sending to a chat failed, marking it dead if permanent."""
+        kind, permanent = classify_send_error(error)
+        self._failures[chat_id] = (kind, permanent, time.time())
+        if permanent and chat_id not in dead_chat_ids:
+            dead_chat_ids.add(chat_id)
+            loggers['tracking'].info("Chat %s marked dead (%s)", chat_id, kind)
+        new_chat_id = getattr(error, "new_chat_id", None)
+        if kind == "migrated" and new_chat_id:
+            # The group lives on as a supergroup under the new ID
+            track_chat_id(new_chat_id, "supergroup")
+            if new_chat_id in dead_chat_ids:
+                self.touch(new_chat_id)
+            loggers['tracking'].info("Chat %s migrated to %s", chat_id, new_chat_id)
+        return kind
+
+    def _write_keywords(self, chat_id, keywords):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if keywords is None:
+                    conn.execute("DELETE FROM chat_keywords WHERE chat_id = ?", (chat_id,))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO chat_keywords (chat_id, keywords) VALUES (?, ?)",
+                        (chat_id, json.dumps(sorted(keywords)))
+                    )
+
+    async def save_keywords(self, chat_id, keywords):
+        """Persist a chat's keyword override, or remove it when keywords is None."""
+        try:
+            await asyncio.to_thread(self._write_keywords, chat_id, keywords)
+        except sqlite3.Error as e:
+            loggers['errors'].error(f"Failed to save keywords for {chat_id}: {str(e)[:50]}")
+
+    def counts(self):
+        """Return live and dead counts for users and groups."""
+        dead_users = dead_chat_ids.count_common(user_ids)
+        dead_groups = dead_chat_ids.count_common(group_ids)
+        return {
+            "live_users": len(user_ids) - dead_users,
+            "dead_users": dead_users,
+            "live_groups": len(group_ids) - dead_groups,
+            "dead_groups": dead_groups,
+        }
+
+    def _write(self, new_rows, seen_rows, failure_rows, invalidate_snapshot=False):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if invalidate_snapshot:
+                    conn.execute("DELETE FROM registry_meta WHERE key = 'snapshot_generation'")
+                conn.executemany(
+                    "INSERT OR IGNORE INTO chats (chat_id, chat_type, first_seen, last_seen) VALUES (?, ?, ?, ?)",
+                    new_rows
+                )
+                conn.executemany(
+                    "UPDATE chats SET last_seen = ?, dead = 0 WHERE chat_id = ?",
+                    seen_rows
+                )
+                conn.executemany(
+                    "UPDATE chats SET failure = ?, failed_at = ?, dead = MAX(dead, ?) WHERE chat_id = ?",
+                    failure_rows
+                )
+
+    async def flush(self):
+        """Write buffered chats, activity and failures to disk off the event loop."""
+        if not (self._pending or self._seen or self._failures):
+            return
+        pending, self._pending = self._pending, {}
+        seen, self._seen = self._seen, {}
+        failures, self._failures = self._failures, {}
+        new_rows = [(chat_id, chat_type, ts, ts) for chat_id, (chat_type, ts) in pending.items()]
+        seen_rows = [(ts, chat_id) for chat_id, ts in seen.items()]
+        failure_rows = [
+            (kind, ts, int(permanent), chat_id)
+            for chat_id, (kind, permanent, ts) in failures.items()
+        ]
+        try:
+            await asyncio.to_thread(
+                self._write, new_rows, seen_rows, failure_rows, self._snapshot_generation is not None
+            )
+            self._snapshot_generation = None
+            loggers['tracking'].debug(
+                f"Flushed {len(new_rows)} new, {len(seen_rows)} seen, {len(failure_rows)} failed chats"
+            )
+        except sqlite3.Error as e:
+            loggers['errors'].error(f"Failed to flush chat registry: {str(e)[:50]}")
+            for chat_id, value in pending.items():
+                self._pending.setdefault(chat_id, value)
+            for chat_id, value in seen.items():
+                self._seen.setdefault(chat_id, value)
+            for chat_id, value in failures.items():
+                self._failures.setdefault(chat_id, value)
+
+    async def run(self):
+        """Flush on a timer until stopped."""
+        while not self._stopping:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        """Load the registry if needed and start the background flusher."""
+        if not self.loaded:
+            await asyncio.to_thread(self.load)
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the flusher, write what is left and close the database."""
+        if self._task:
+            self._stopping = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        # Only a fully flushed, single-process registry matches the database exactly
+        unflushed = self._pending or self._seen or self._failures
+        if self.snapshot_path and self.loaded and not self.shared and not unflushed:
+            try:
+                await asyncio.to_thread(self._save_snapshot)
+            except (OSError, sqlite3.Error) as e:
+                loggers['errors'].error(f"Failed to write chat snapshot: {str(e)[:50]}")
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+chat_registry = ChatRegistry()
+
+
+def _tracked_chat_counts():
+    # The front process in multi-worker mode holds no chats; the workers' counts are not visible here
+    if not chat_registry.loaded:
+        return {}
+    counts = chat_registry.counts()
+    return {
+        (("type", "user"), ("state", "live")): counts["live_users"],
+        (("type", "user"), ("state", "dead")): counts["dead_users"],
+        (("type", "group"), ("state", "live")): counts["live_groups"],
+        (("type", "group"), ("state", "dead")): counts["dead_groups"],
+    }
+
+
+metrics.gauge("tracked_chats", _tracked_chat_counts)
+
+
+def track_chat_id(chat_id, chat_type):
+    """Track user and group IDs and note chat activity."""
+    try:
+        if chat_type == "private":
+            if chat_id not in user_ids:
+                user_ids.add(chat_id)
+                chat_registry.record(chat_id, chat_type)
+                loggers['tracking'].info("New user tracked: %s (Total: %s)", chat_id, len(user_ids))
+            else:
+                chat_registry.touch(chat_id)
+        elif chat_type in ["group", "supergroup"]:
+            if chat_id not in group_ids:
+                group_ids.add(chat_id)
+                chat_registry.record(chat_id, chat_type)
+                loggers['tracking'].info("New group tracked: %s (Total: %s)", chat_id, len(group_ids))
+            else:
+                chat_registry.touch(chat_id)
+    except Exception as e:
+        loggers['errors'].error(f"Error tracking chat ID {chat_id}: {str(e)[:50]}")
+
+
+@instrumented("start_command")
+async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /start command."""
+    try:
+        user_id = update.effective_user.id if update.effective_user else None
+        loggers['commands'].info("/start from user %s", user_id)
+        
+        await react_to_message(update, context)
+        user = update.effective_user
+        chat_id = update.effective_chat.id
+
+        if not user:
+            loggers['errors'].error("No user found in /start command")
+            return
+
+        # Initialize user state
+        user_button_state[user.id] = {"updates": False, "group": False, "addme": False}
+
+        # Track chat ID
+        track_chat_id(chat_id, update.effective_chat.type)
+
+        # Throttled: the reaction above is the whole response
+        if not allow_image_trigger(chat_id, user.id):
+            return
+
+        # Send typing action before responding
+        await send_chat_action(context, chat_id, ChatAction.TYPING)
+        
+        # Send loading message and then welcome image
+        emoji_msg = get_random_emoji()
+        try:
+            loading_msg = await context.bot.send_message(chat_id=chat_id, text=emoji_msg)
+        except Exception as e:
+            loggers['errors'].error(f"Failed to send loading message: {str(e)[:50]}")
+            return
+
+        await send_image(chat_id, user, context.bot, loading_msg=loading_msg)
+        loggers['commands'].info("/start completed for user %s", user.id)
+        
+    except Exception as e:
+        loggers['errors'].critical(f"Critical error in /start: {str(e)[:50]}")
+        try:
+            await update.message.reply_text(ERROR_MESSAGES["general_error"])
+        except:
+            pass
+
+
+@instrumented("ping_command")
+async def ping_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /ping command."""
+    try:
+        user_id = update.effective_user.id if update.effective_user else None
+        loggers['commands'].info("/ping from user %s", user_id)
+
+        await react_to_message(update, context)
+
+        # Show typing action before ping
+        await send_chat_action(context, update.effective_chat.id, ChatAction.TYPING)
+
+        start_time = time.time()
+        try:
+            msg = await update.message.reply_text(STATUS_MESSAGES["pinging"])
+        except Exception as e:
+            loggers['errors'].error(f"Failed to send ping message: {str(e)[:50]}")
+            return
+
+        response_time = round((time.time() - start_time) * 1000, 2)
+
+        try:
+            await msg.edit_text(
+                f"🏓 <a href='https://t.me/SoulMeetsHQ'>Pong!</a> {response_time}ms",
+                parse_mode="HTML",
+                disable_web_page_preview=True
+            )
+            loggers['commands'].info("/ping completed with %sms latency", response_time)
+        except Exception as e:
+            loggers['errors'].error(f"Failed to edit ping message: {str(e)[:50]}")
+
+    except Exception as e:
+        loggers['errors'].critical(f"Critical error in /ping: {str(e)[:50]}")
+        try:
+            await update.message.reply_text(ERROR_MESSAGES["ping_failed"])
+        except:
+            pass
+
+
+class TokenBucket:
+    """Token bucket rate limiter that can also be paused by a flood-wait."""
+
+    def __init__(self, rate, capacity=None, per=1.0):
+        self.rate = rate / per
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def try_acquire(self):
+        """Take a token if available; otherwise return the seconds to wait."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def refund(self):
+        """Return a token taken for an action that did not go ahead."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for the given number of seconds."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class KeyedTokenBucket:
+    """One token bucket per key, created on first use, least recently used evicted."""
+
+    def __init__(self, rate, capacity=None, per=1.0, max_keys=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.per = per
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def get(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity, self.per)
+            if self.max_keys and len(self._buckets) > self.max_keys:
+                # The least recently used bucket has been idle longest, so it has refilled
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def try_acquire(self, key):
+        """Take a token for key without waiting; return True on success."""
+        return self.get(key).try_acquire() <= 0
+
+    async def acquire(self, key):
+        await self.get(key).acquire()
+
+    def refund(self, key):
+        self.get(key).refund()
+
+
+# Telegram allows about 30 messages/s overall and 20 messages/min per group
+broadcast_limiter = TokenBucket(BROADCAST_RATE)
+group_send_limiter = KeyedTokenBucket(BROADCAST_GROUP_RATE, capacity=1, per=60.0, max_keys=BROADCAST_GROUP_MAX_KEYS)
+
+# Flood control in front of the image path, per chat and per user
+chat_flood_limiter = KeyedTokenBucket(FLOOD_CHAT_RATE, FLOOD_CHAT_BURST, per=60.0, max_keys=FLOOD_MAX_KEYS)
+user_flood_limiter = KeyedTokenBucket(FLOOD_USER_RATE, FLOOD_USER_BURST, per=60.0, max_keys=FLOOD_MAX_KEYS)
+metrics.describe("flood_throttled_total", "counter", "Image triggers throttled by flood control.")
+metrics.describe("flood_limiter_keys", "gauge", "Tracked flood-control buckets.")
+metrics.gauge("flood_limiter_keys", lambda: {
+    (("scope", "chat"),): len(chat_flood_limiter),
+    (("scope", "user"),): len(user_flood_limiter),
+})
+
+
+def allow_image_trigger(chat_id, user_id):
+    """Return True if this chat and user may trigger another image right now."""
+    if user_id is not None and not user_flood_limiter.try_acquire(user_id):
+        metrics.inc("flood_throttled_total", labels=(("scope", "user"),))
+        loggers['image'].debug("Throttled image trigger from user %s", user_id)
+        return False
+    if not chat_flood_limiter.try_acquire(chat_id):
+        # The trigger is dropped, so it should not count against the user's budget
+        if user_id is not None:
+            user_flood_limiter.refund(user_id)
+        metrics.inc("flood_throttled_total", labels=(("scope", "chat"),))
+        loggers['image'].debug("Throttled image trigger in chat %s", chat_id)
+        return False
+    return True
+
+
+class BroadcastJob:
+    """A broadcast with an on-disk checkpoint so it can survive restarts."""
+
+    def __init__(self, job_id, from_chat_id, message_id, targets, target_name="chats",
+                 progress_message_id=None, cursor=0, done_ahead=(), sent=0, failed=0,
+                 status="running", created_at=None, chat_action=None):
+        self.job_id = job_id
+        self.from_chat_id = from_chat_id
+        self.message_id = message_id
+        self.targets = targets
+        self.target_name = target_name
+        self.progress_message_id = progress_message_id
+        self.cursor = cursor
+        self.done_ahead = set(done_ahead)
+        self.sent = sent
+        self.failed = failed
+        self.status = status
+        self.created_at = created_at or time.time()
+        # None skips per-recipient chat actions entirely (the default)
+        self.chat_action = chat_action
+        # Targets never change, so they are written to their sidecar file only once
+        self.targets_saved = False
+
+    @property
+    def total(self):
+        return len(self.targets)
+
+    @property
+    def remaining(self):
+        return self.total - self.cursor - len(self.done_ahead)
+
+    @property
+    def path(self):
+        return os.path.join(BROADCAST_JOBS_DIR, f"{self.job_id}.json")
+
+    @property
+    def targets_path(self):
+        return os.path.join(BROADCAST_JOBS_DIR, f"{self.job_id}.targets")
+
+    def pending(self):
+        """Yield (index, chat_id) for every target not yet completed."""
+        for index in range(self.cursor, self.total):
+            if index not in self.done_ahead:
+                yield index, self.targets[index]
+
+    def mark_done(self, index, success):
+        """Record a finished recipient and advance the contiguous cursor."""
+        if success:
+            self.sent += 1
+        else:
+            self.failed += 1
+
+        if index == self.cursor:
+            self.cursor += 1
+            while self.cursor in self.done_ahead:
+                self.done_ahead.remove(self.cursor)
+                self.cursor += 1
+        else:
+            self.done_ahead.add(index)
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "from_chat_id": self.from_chat_id,
+            "message_id": self.message_id,
+            "target_name": self.target_name,
+            "progress_message_id": self.progress_message_id,
+            "cursor": self.cursor,
+            "done_ahead": sorted(self.done_ahead),
+            "sent": self.sent,
+            "failed": self.failed,
+            "status": self.status,
+            "created_at": self.created_at,
+            "chat_action": self.chat_action,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        if "targets" in data:
+            # Checkpoint from before targets moved to the sidecar file
+            job = cls(**dict(data, targets=array("q", data["targets"])))
+        else:
+            targets = array("q")
+            with open(os.path.join(BROADCAST_JOBS_DIR, f"{data['job_id']}.targets"), "rb") as f:
+                targets.frombytes(f.read())
+            job = cls(targets=targets, **data)
+            job.targets_saved = True
+        return job
+
+    def _save_targets(self):
+        tmp_path = f"{self.targets_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            self.targets.tofile(f)
+        os.replace(tmp_path, self.targets_path)
+        self.targets_saved = True
+
+    def save(self):
+        """Write the checkpoint atomically; the targets go to their sidecar on the first save only."""
+        os.makedirs(BROADCAST_JOBS_DIR, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            if not self.targets_saved:
+                self._save_targets()
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            loggers['errors'].error(f"Failed to checkpoint broadcast job {self.job_id}: {str(e)[:50]}")
+
+    @property
+    def lock_path(self):
+        return f"{self.path}.lock"
+
+    @property
+    def control_path(self):
+        return os.path.join(BROADCAST_JOBS_DIR, f"{self.job_id}.control")
+
+    def request(self, action):
+        """Leave a control request for the process running this job."""
+        with open(self.control_path, "w", encoding="utf-8") as f:
+            f.write(action)
+
+    def take_request(self):
+        """Return and remove a pending control request, or None."""
+        try:
+            with open(self.control_path, "r", encoding="utf-8") as f:
+                action = f.read().strip()
+            os.remove(self.control_path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            loggers['errors'].error(f"Failed to read control request for {self.job_id}: {str(e)[:50]}")
+            return None
+        return action
+
+    def delete(self):
+        """Remove the checkpoint and its side files once the job is finished or cancelled."""
+        for path in (self.path, self.targets_path, self.control_path, self.lock_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                loggers['errors'].error(f"Failed to remove broadcast job {self.job_id}: {str(e)[:50]}")
+
+    def summary(self):
+        return (
+            f"<code>{self.job_id}</code> {self.status} - {self.target_name}: "
+            f"{self.sent} sent, {self.failed} failed, {self.remaining} left of {self.total}"
+        )
+
+
+class BroadcastEngine:
+    """Fan a broadcast job out with bounded workers and rate limits."""
+
+    def __init__(self, bot, job, workers=BROADCAST_WORKERS, max_retries=BROADCAST_MAX_RETRIES,
+                 progress_interval=BROADCAST_PROGRESS_INTERVAL):
+        self.bot = bot
+        self.job = job
+        self.workers = workers
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self.sent = 0
+        self.retried = 0
+        self.started_at = None
+        self.finished_at = None
+        self._queue = asyncio.Queue()
+        self._stop_requested = asyncio.Event()
+
+    @property
+    def rate(self):
+        """Messages sent per second by this run."""
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def progress_text(self):
+        return STATUS_MESSAGES["broadcast_progress"].format(
+            total=self.job.total,
+            target=self.job.target_name,
+            sent=self.job.sent,
+            failed=self.job.failed,
+            rate=self.rate
+        )
+
+    async def _send(self, chat_id):
+        if self.job.chat_action:
+            await broadcast_limiter.acquire()
+            await send_bot_chat_action(self.bot, chat_id, self.job.chat_action)
+        # Wait for the group first, so the global token is not held idle meanwhile
+        if chat_id < 0:
+            await group_send_limiter.acquire(chat_id)
+        await broadcast_limiter.acquire()
+        await self.bot.copy_message(
+            chat_id=chat_id,
+            from_chat_id=self.job.from_chat_id,
+            message_id=self.job.message_id
+        )
+
+    async def _worker(self):
+        while not self._stop_requested.is_set():
+            index, chat_id, attempt = await self._queue.get()
+            try:
+                if self._stop_requested.is_set():
+                    continue
+                if chat_id in dead_chat_ids:
+                    self.job.mark_done(index, False)
+                    continue
+                await self._send(chat_id)
+                self.sent += 1
+                self.job.mark_done(index, True)
+            except telegram.error.RetryAfter as e:
+                retry_after = get_retry_after(e)
+                loggers['broadcast'].warning(f"Flood control hit, pausing for {retry_after}s")
+                broadcast_limiter.pause(retry_after)
+                self.retried += 1
+                self._queue.put_nowait((index, chat_id, attempt))
+            except (telegram.error.Forbidden, telegram.error.BadRequest, telegram.error.ChatMigrated) as e:
+                chat_registry.record_failure(chat_id, e)
+                self.job.mark_done(index, False)
+            except telegram.error.NetworkError as e:
+                if attempt < self.max_retries:
+                    self.retried += 1
+                    self._queue.put_nowait((index, chat_id, attempt + 1))
+                else:
+                    chat_registry.record_failure(chat_id, e)
+                    self.job.mark_done(index, False)
+            except Exception as e:
+                loggers['errors'].error(f"Unexpected error broadcasting to {chat_id}: {str(e)[:50]}")
+                self.job.mark_done(index, False)
+            finally:
+                self._queue.task_done()
+
+    async def _report_progress(self):
+        last_text = None
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self.job.save()
+            text = self.progress_text()
+            if text != last_text:
+                await self.update_progress(text)
+                last_text = text
+
+    async def update_progress(self, text):
+        """Edit the live progress message, if there is one."""
+        if not self.job.progress_message_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                chat_id=self.job.from_chat_id,
+                message_id=self.job.progress_message_id,
+                text=text
+            )
+        except telegram.error.RetryAfter as e:
+            broadcast_limiter.pause(get_retry_after(e))
+        except Exception as e:
+            loggers['broadcast'].debug("Failed to edit progress message: %s", str(e)[:50])
+
+    def stop(self):
+        """Ask the workers to stop after their current send."""
+        self._stop_requested.set()
+
+    async def run(self):
+        """Send to every pending target; return when done or stopped."""
+        for index, chat_id in self.job.pending():
+            self._queue.put_nowait((index, chat_id, 0))
+
+        self.started_at = time.monotonic()
+        worker_count = max(1, min(self.workers, self._queue.qsize()))
+        tasks = [asyncio.create_task(self._worker()) for _ in range(worker_count)]
+        reporter = asyncio.create_task(self._report_progress())
+        joined = asyncio.create_task(self._queue.join())
+        stopped = asyncio.create_task(self._stop_requested.wait())
+        try:
+            await asyncio.wait([joined, stopped], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.finished_at = time.monotonic()
+            for task in tasks + [reporter, joined, stopped]:
+                task.cancel()
+            await asyncio.gather(*tasks, reporter, joined, stopped, return_exceptions=True)
+
+        loggers['broadcast'].info(
+            f"Broadcast job {self.job.job_id}: {self.job.sent} sent, {self.job.failed} failed, "
+            f"{self.retried} retried, {self.rate:.1f} msg/s"
+        )
+        return self
+
+
+class BroadcastJobManager:
+    """Runs broadcast jobs in the background and resumes them after a restart."""
+
+    def __init__(self):
+        self.jobs = {}
+        self._engines = {}
+        self._tasks = {}
+        self._locks = {}
+        self._adopter = None
+        self.bot = None
+
+    def create(self, from_chat_id, message_id, targets, target_name, progress_message_id=None,
+               chat_action=None):
+        job = BroadcastJob(
+            uuid.uuid4().hex[:8],
+            from_chat_id=from_chat_id,
+            message_id=message_id,
+            targets=array("q", targets),
+            target_name=target_name,
+            progress_message_id=progress_message_id,
+            chat_action=chat_action
+        )
+        job.save()
+        self.jobs[job.job_id] = job
+        return job
+
+    @staticmethod
+    def _read(job_id):
+        """Read a job's checkpoint, or return None if it is gone."""
+        try:
+            with open(os.path.join(BROADCAST_JOBS_DIR, f"{job_id}.json"), "r", encoding="utf-8") as f:
+                return BroadcastJob.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            loggers['errors'].error(f"Failed to load broadcast job {job_id}: {str(e)[:50]}")
+            return None
+
+    def load(self):
+        """Load unfinished jobs from their checkpoints."""
+        if not os.path.isdir(BROADCAST_JOBS_DIR):
+            return
+        for name in os.listdir(BROADCAST_JOBS_DIR):
+            if not name.endswith(".json"):
+                continue
+            job = self._read(name[:-len(".json")])
+            if job is not None:
+                self.jobs[job.job_id] = job
+        if self.jobs:
+            loggers['broadcast'].info("Loaded %s unfinished broadcast jobs", len(self.jobs))
+
+    def refresh(self):
+        """Re-read jobs this process does not hold from disk; other workers may run or change them."""
+        held = {job_id: job for job_id, job in self.jobs.items() if job_id in self._locks}
+        self.jobs = {}
+        self.load()
+        self.jobs.update(held)
+
+    def _claim(self, job):
+        """Lock the job's lock file so only one process (e.g. one of several workers) runs it."""
+        os.makedirs(BROADCAST_JOBS_DIR, exist_ok=True)
+        try:
+            handle = open(job.lock_path, "w")
+        except OSError as e:
+            loggers['errors'].error(f"Failed to open lock for broadcast job {job.job_id}: {str(e)[:50]}")
+            return False
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._locks[job.job_id] = handle
+        return True
+
+    def _release(self, job_id):
+        handle = self._locks.pop(job_id, None)
+        if handle is not None:
+            handle.close()
+
+    def start(self, job):
+        """Run a job in the background."""
+        if job.job_id in self._tasks:
+            return
+        if job.job_id not in self._locks and not self._claim(job):
+            loggers['broadcast'].debug("Broadcast job %s is running in another process", job.job_id)
+            return
+        job.status = "running"
+        job.save()
+        engine = BroadcastEngine(self.bot, job)
+        self._engines[job.job_id] = engine
+        self._tasks[job.job_id] = asyncio.create_task(self._run(engine))
+
+    async def _watch_requests(self, job):
+        """Apply pause/cancel requests other processes leave for this job."""
+        while True:
+            await asyncio.sleep(BROADCAST_CONTROL_POLL)
+            action = job.take_request()
+            if action:
+                applied = self._apply(job.job_id, action)
+                loggers['broadcast'].info("Control request %s for job %s applied: %s", action, job.job_id, applied)
+
+    async def _run(self, engine):
+        job = engine.job
+        watcher = asyncio.create_task(self._watch_requests(job))
+        try:
+            await engine.run()
+        except Exception as e:
+            loggers['errors'].critical(f"Critical error in broadcast job {job.job_id}: {str(e)[:50]}")
+        finally:
+            watcher.cancel()
+            self._engines.pop(job.job_id, None)
+
+        # Keep the lock until the final checkpoint is written, so an adopter never reads a stale one
+        try:
+            await engine.update_progress(engine.progress_text())
+            if job.status == "running" and job.remaining > 0:
+                # Stopped without an owner request (shutdown); left for another process to adopt
+                job.save()
+                return
+
+            if job.status == "paused":
+                job.save()
+                return
+
+            self.jobs.pop(job.job_id, None)
+            job.delete()
+        finally:
+            self._tasks.pop(job.job_id, None)
+            self._release(job.job_id)
+        if job.status == "cancelled":
+            return
+
+        job.status = "done"
+        try:
+            result_text = f"📢 Broadcast sent to {job.sent} {job.target_name}."
+            if job.failed > 0:
+                result_text += f"\n⚠️ {job.failed} failed to receive the message."
+            await self.bot.send_message(
+                chat_id=job.from_chat_id,
+                text=result_text,
+                reply_to_message_id=job.message_id
+            )
+            loggers['broadcast'].info("Broadcast completion message sent")
+        except Exception as e:
+            loggers['errors'].error(f"Failed to send broadcast completion: {str(e)[:50]}")
+
+    def adopt(self):
+        """Start running jobs no process holds, e.g. ones a stopped worker checkpointed."""
+        if not os.path.isdir(BROADCAST_JOBS_DIR):
+            return
+        for name in os.listdir(BROADCAST_JOBS_DIR):
+            if not name.endswith(".json"):
+                continue
+            job_id = name[:-len(".json")]
+            if job_id in self._locks:
+                continue
+            job = self._read(job_id)
+            if job is None or job.status != "running" or not self._claim(job):
+                continue
+            # Re-read under the lock: the previous holder may have checkpointed since
+            job = self._read(job_id)
+            if job is None or job.status != "running":
+                self._release(job_id)
+                continue
+            loggers['broadcast'].info("Resuming broadcast job %s at %s/%s", job.job_id, job.cursor, job.total)
+            self.jobs[job_id] = job
+            self.start(job)
+
+    async def _adopt_loop(self):
+        while True:
+            await asyncio.sleep(BROADCAST_ADOPT_INTERVAL)
+            try:
+                self.adopt()
+            except Exception as e:
+                loggers['errors'].error(f"Error adopting broadcast jobs: {str(e)[:50]}")
+
+    def resume_interrupted(self, bot):
+        """Restart jobs that were running when the process stopped, and keep adopting orphaned ones."""
+        self.bot = bot
+        self.load()
+        self.adopt()
+        if BROADCAST_ADOPT_INTERVAL > 0 and (self._adopter is None or self._adopter.done()):
+            self._adopter = asyncio.create_task(self._adopt_loop())
+
+    def _apply(self, job_id, action):
+        """Pause, resume or cancel a job whose lock this process holds."""
+        job = self.jobs.get(job_id)
+        if not job:
+            return False
+        engine = self._engines.get(job_id)
+        if action == "pause":
+            if job.status != "running":
+                return False
+            job.status = "paused"
+            if engine:
+                engine.stop()
+            job.save()
+            return True
+        if action == "resume":
+            # A paused engine that is still finishing its in-flight sends cannot be restarted yet
+            if job.status != "paused" or job_id in self._tasks:
+                return False
+            self.start(job)
+            return True
+        if action == "cancel":
+            job.status = "cancelled"
+            if engine:
+                engine.stop()
+            else:
+                self.jobs.pop(job_id, None)
+                job.delete()
+            return True
+        return False
+
+    async def _control(self, job_id, action):
+        """Apply action to a job and return True only once it has taken effect.
+
+        The process holding the job's lock applies it. Any other process takes the lock
+        itself if the job is idle, or else leaves a request for the holder and waits
+        for the checkpoint to show the result.
+        """
+        if job_id in self._locks:
+            return self._apply(job_id, action)
+        job = self._read(job_id)
+        if job is None:
+            self.jobs.pop(job_id, None)
+            return False
+        self.jobs[job_id] = job
+        if self._claim(job):
+            try:
+                return self._apply(job_id, action)
+            finally:
+                if job_id not in self._tasks:
+                    self._release(job_id)
+        if action == "resume":
+            # Held elsewhere, so it is running or still draining
+            return False
+        return await self._request(job, action)
+
+    async def _request(self, job, action):
+        try:
+            job.request(action)
+        except OSError as e:
+            loggers['errors'].error(f"Failed to request {action} for job {job.job_id}: {str(e)[:50]}")
+            return False
+        deadline = time.monotonic() + BROADCAST_CONTROL_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(BROADCAST_CONTROL_POLL / 2)
+            if os.path.exists(job.control_path):
+                continue
+            current = self._read(job.job_id)
+            if action == "cancel" and (current is None or current.status == "cancelled"):
+                self.jobs.pop(job.job_id, None)
+                return True
+            if action == "pause" and current is not None and current.status == "paused":
+                self.jobs[job.job_id] = current
+                return True
+        # Withdraw the request so it does not take effect after we reported failure
+        try:
+            os.remove(job.control_path)
+        except OSError:
+            pass
+        loggers['broadcast'].warning("No confirmation of %s for broadcast job %s", action, job.job_id)
+        return False
+
+    async def pause(self, job_id):
+        return await self._control(job_id, "pause")
+
+    async def resume(self, job_id):
+        return await self._control(job_id, "resume")
+
+    async def cancel(self, job_id):
+        return await self._control(job_id, "cancel")
+
+    async def shutdown(self):
+        """Stop running jobs and checkpoint them for the next start."""
+        if self._adopter:
+            self._adopter.cancel()
+            self._adopter = None
+        for engine in list(self._engines.values()):
+            engine.stop()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+broadcast_jobs = BroadcastJobManager()
+
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /broadcast command (owner only)."""
+    try:
+        user_id = update.effective_user.id if update.effective_user else None
+        loggers['broadcast'].info("/broadcast from user %s", user_id)
+        
+        if user_id != OWNER_ID:
+            loggers['broadcast'].warning(f"Unauthorized broadcast attempt from {user_id}")
+            return
+
+        loggers['broadcast'].info("Authorized broadcast request from owner")
+
+        # Show typing action before showing broadcast menu  
+        await send_chat_action(context, update.effective_chat.id, ChatAction.TYPING)
+
+        keyboard = [
+            [InlineKeyboardButton("👤 User", callback_data="broadcast_user"), 
+             InlineKeyboardButton("👥 Group", callback_data="broadcast_group")],
+            [InlineKeyboardButton("🌐 All", callback_data="broadcast_all"), 
+             InlineKeyboardButton("❌ Cancel", callback_data="broadcast_cancel")]
+        ]
+        
+        try:
+            await update.message.reply_text("📢 Choose broadcast target:", reply_markup=InlineKeyboardMarkup(keyboard))
+            loggers['broadcast'].info("Broadcast menu sent to owner")
+        except Exception as e:
+            loggers['errors'].error(f"Failed to send broadcast menu: {str(e)[:50]}")
+            
+    except Exception as e:
+        loggers['errors'].critical(f"Critical error in /broadcast: {str(e)[:50]}")
+
+
+async def httpstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /httpstats command (owner only)."""
+    try:
+        user_id = update.effective_user.id if update.effective_user else None
+        loggers['commands'].info("/httpstats from user %s", user_id)
+
+        if user_id != OWNER_ID:
+            loggers['commands'].warning(f"Unauthorized httpstats attempt from {user_id}")
+            return
+
+        stats = http_client.stats()
+        if not stats:
+            text = "🌐 No outbound HTTP requests yet."
+        else:
+            lines = ["🌐 <b>Outbound HTTP</b>"]
+            for host, host_stats in stats.items():
+                lines.append(
+                    f"<code>{host}</code>: {host_stats['requests']} req, "
+                    f"{host_stats['new_connections']} new / {host_stats['reused_connections']} reused conn, "
+                    f"{host_stats['dns_cache_hits']} dns hits, {host_stats['errors']} errors"
+                )
+            text = "\n".join(lines)
+        for source in image_sources.sources:
+            text += (
+                f"\n🔌 Image source <code>{source.name}</code>: circuit <b>{source.breaker.state}</b> "
+                f"({source.breaker.short_circuited} short-circuited)"
+            )
+
+        try:
+            await update.message.reply_text(text)
+        except Exception as e:
+            loggers['errors'].error(f"Failed to send http stats: {str(e)[:50]}")
+
+    except Exception as e:
+        loggers['errors'].critical(f"Critical error in /httpstats: {str(e)[:50]}")
+
+
+async def chats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /chats command (owner only) - show live and dead chat counts."""
+    try:
+        user_id = update.effective_user.id if update.effective_user else None
+        loggers['commands'].info("/chats from user %s", user_id)
+
+        if user_id != OWNER_ID:
+            loggers['commands'].warning(f"Unauthorized chats attempt from {user_id}")
+            return
+
+        await chat_registry.sync()
+        counts = chat_registry.counts()
+        text = (
+            "👥 <b>Chats</b>\n"
+            f"Users: {counts['live_users']} live, {counts['dead_users']} dead\n"
+            f"Groups: {counts['live_groups']} live, {counts['dead_groups']} dead"
+        )
+
+        try:
+            await update.message.reply_text(text)
+        except Exception as e:
+            loggers['errors'].error(f"Failed to send chat counts: {str(e)[:50]}")
+
+    except Exception as e:
+        loggers['errors'].critical(f"Critical error in /chats: {str(e)[:50]}")
+
+
+async def keywords_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /keywords command (owner only) - show or override a chat's trigger words.
+
+    /keywords [chat_id]              show keywords
+    /keywords chat_id set a,b,c      override keywords for a chat
+    /keywords chat_id reset          restore the defaults
+    """
+    try:
+        user_id = update.effective_user.id if update.effective_user else None
+        loggers['commands'].info("/keywords from user %s", user_id)
+
+        if user_id != OWNER_ID:
+            loggers['commands'].warning(f"Unauthorized keywords attempt from {user_id}")
+            return
+
+        args = context.args or []
+        try:
+            chat_id = int(args[0]) if args else update.effective_chat.id
+        except ValueError:
+            await update.message.reply_text("Usage: /keywords [chat_id] [set a,b,c | reset]")
+            return
+
+        if len(args) >= 3 and args[1] == "set":
+            keywords = [word.strip().lower() for word in " ".join(args[2:]).split(",") if word.strip()]
+            if not keywords:
+                await update.message.reply_text("⚠️ Give at least one keyword.")
+                return
+            trigger_engine.set_chat_keywords(chat_id, keywords)
+            await chat_registry.save_keywords(chat_id, keywords)
+        elif len(args) >= 2 and args[1] == "reset":
+            trigger_engine.set_chat_keywords(chat_id, None)
+            await chat_registry.save_keywords(chat_id, None)
+
+        keywords = ", ".join(sorted(trigger_engine.keywords_for(chat_id)))
+        text = f"🔑 Keywords for <code>{chat_id}</code>: {keywords}"
+
+        try:
+            await update.message.reply_text(text)
+        except Exception as e:
+            loggers['errors'].error(f"Failed to send keywords: {str(e)[:50]}")
+
+    except Exception as e:
+        loggers['errors'].critical(f"Critical error in /keywords: {str(e)[:50]}")
+
+
+async def jobs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /jobs command (owner only) - list unfinished broadcast jobs."""
+    try:
+        user_id = update.effective_user.id if update.effective_user else None
+        loggers['broadcast'].info("/jobs from user %s", user_id)
+
+        if user_id != OWNER_ID:
+            loggers['broadcast'].warning(f"Unauthorized jobs attempt from {user_id}")
+            return
+
+        # Jobs run by other workers are only current on disk
+        broadcast_jobs.refresh()
+        if broadcast_jobs.jobs:
+            text = "📋 <b>Broadcast jobs</b>\n" + "\n".join(job.summary() for job in broadcast_jobs.jobs.values())
+        else:
+            text = "📋 No unfinished broadcast jobs."
+
+        try:
+            await update.message.reply_text(text)
+        except Exception as e:
+            loggers['errors'].error(f"Failed to send jobs list: {str(e)[:50]}")
+
+    except Exception as e:
+        loggers['errors'].critical(f"Critical error in /jobs: {str(e)[:50]}")
+
+
+async def job_control_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /pausejob, /resumejob and /canceljob commands (owner only)."""
+    try:
+        user_id = update.effective_user.id if update.effective_user else None
+        command = update.message.text.split()[0].lstrip("/").split("@")[0]
+        loggers['broadcast'].info("/%s from user %s", command, user_id)
+
+        if user_id != OWNER_ID:
+            loggers['broadcast'].warning(f"Unauthorized {command} attempt from {user_id}")
+            return
+
+        if not context.args:
+            await update.message.reply_text(f"Usage: /{command} &lt;job id&gt;")
+            return
+
+        job_id = context.args[0]
+        actions = {
+            "pausejob": (broadcast_jobs.pause, "⏸️ Paused", "paused"),
+            "resumejob": (broadcast_jobs.resume, "▶️ Resumed", "resumed"),
+            "canceljob": (broadcast_jobs.cancel, "❌ Cancelled", "cancelled"),
+        }
+        action, label, verb = actions[command]
+
+        if await action(job_id):
+            text = f"{label} broadcast job <code>{job_id}</code>."
+            loggers['broadcast'].info("/%s applied to broadcast job %s", command, job_id)
+        else:
+            text = f"⚠️ No broadcast job <code>{job_id}</code> that can be {verb} right now."
+
+        try:
+            await update.message.reply_text(text)
+        except Exception as e:
+            loggers['errors'].error(f"Failed to send job control reply: {str(e)[:50]}")
+
+    except Exception as e:
+        loggers['errors'].critical(f"Critical error in job control: {str(e)[:50]}")
+
+
+class Profiler:
+    """Owner-triggered cProfile sessions and tracemalloc snapshot diffs."""
+
+    def __init__(self, top_n=PROFILE_TOP_N, frames=TRACEMALLOC_FRAMES):
+        self.top_n = top_n
+        self.frames = frames
+        self._profile = None
+        self._task = None
+        self._snapshot = None
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self, bot, chat_id, seconds, top_n=None):
+        """Profile everything on the event loop for seconds, then send the report to chat_id."""
+        if self.running:
+            return False
+        # All handlers run on the loop thread, so one profiler sees every coroutine step
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        self._task = asyncio.create_task(self._finish_after(bot, chat_id, seconds, top_n or self.top_n))
+        return True
 
-        await send_image(chat_id, user, context.bot, loading_msg=loading_msg)
-        loggers['commands'].info(f"/start completed for user {user.id}")
-        
-    except Exception as e:
-        loggers['errors'].critical(f"Critical error in /start: {str(e)[:50]}")
+    def stop(self):
+        """End the running session early; the report is still sent."""
+        if self._task is None:
+            return False
+        self._task.cancel()
+        return True
+
+    async def _finish_after(self, bot, chat_id, seconds, top_n):
+        started = time.monotonic()
         try:
-            await update.message.reply_text(ERROR_MESSAGES["general_error"])
-        except:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
             pass
+        profile, self._profile, self._task = self._profile, None, None
+        profile.disable()
+        elapsed = time.monotonic() - started
 
+        report = io.StringIO()
+        report.write(f"cProfile over {elapsed:.1f}s, top {top_n} by own time\n\n")
+        stats = pstats.Stats(profile, stream=report)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(top_n)
+        report.write(f"\n\nTop {top_n} by cumulative time\n\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top_n)
+        loggers['profile'].info("Profile finished after %.1fs", elapsed)
+        await self.send_report(bot, chat_id, report.getvalue(), f"profile-{int(time.time())}.txt",
+                         f"🔬 Profile over {elapsed:.1f}s")
 
-async def ping_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /ping command."""
-    try:
-        user_id = update.effective_user.id if update.effective_user else None
-        loggers['commands'].info(f"/ping from user {user_id}")
+    def memory_report(self, top_n=None):
+        """Diff a new tracemalloc snapshot against the previous one; start tracing on first use."""
+        top_n = top_n or self.top_n
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._snapshot = None
 
-        await react_to_message(update, context)
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        previous, self._snapshot = self._snapshot, snapshot
 
-        # Show typing action before ping
-        await send_chat_action(context, update.effective_chat.id, ChatAction.TYPING)
+        report = io.StringIO()
+        current, peak = tracemalloc.get_traced_memory()
+        report.write(f"Traced memory: {current / 1024:.0f} KiB (peak {peak / 1024:.0f} KiB)\n\n")
+        report.write("State containers (entries, shallow size):\n")
+        for name, container in (("user_button_state", user_button_state), ("broadcast_mode", broadcast_mode),
+                                ("user_ids", user_ids), ("group_ids", group_ids),
+                                ("dead_chat_ids", dead_chat_ids)):
+            report.write(f"  {name}: {len(container)} entries, {sys.getsizeof(container) / 1024:.1f} KiB\n")
 
-        start_time = time.time()
+        if previous is None:
+            report.write(f"\nBaseline taken. Top {top_n} allocation sites:\n")
+            for stat in snapshot.statistics("lineno")[:top_n]:
+                report.write(f"  {stat}\n")
+        else:
+            report.write(f"\nTop {top_n} changes since the previous snapshot:\n")
+            for stat in snapshot.compare_to(previous, "lineno")[:top_n]:
+                report.write(f"  {stat}\n")
+        return report.getvalue()
+
+    def stop_tracing(self):
+        self._snapshot = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            return True
+        return False
+
+    async def send_report(self, bot, chat_id, text, filename, caption):
         try:
-            msg = await update.message.reply_text(STATUS_MESSAGES["pinging"])
+            await bot.send_document(
+                chat_id=chat_id,
+                document=telegram.InputFile(text.encode("utf-8"), filename=filename),
+                caption=caption
+            )
         except Exception as e:
-            loggers['errors'].error(f"Failed to send ping message: {str(e)[:50]}")
+            loggers['errors'].error(f"Failed to send profiling report: {str(e)[:50]}")
+
+
+profiler = Profiler()
+
+
+def parse_profile_args(args):
+    """Parse "[seconds] [top]" into bounded (seconds, top_n)."""
+    seconds = float(args[0]) if args else PROFILE_DEFAULT_SECONDS
+    top_n = int(args[1]) if len(args) > 1 else PROFILE_TOP_N
+    return min(max(seconds, 1.0), PROFILE_MAX_SECONDS), max(top_n, 1)
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /profile [seconds] [top] and /profile stop (owner only)."""
+    try:
+        user_id = update.effective_user.id if update.effective_user else None
+        loggers['profile'].info("/profile from user %s", user_id)
+
+        if user_id != OWNER_ID:
+            loggers['profile'].warning(f"Unauthorized profile attempt from {user_id}")
             return
 
-        response_time = round((time.time() - start_time) * 1000, 2)
+        if context.args and context.args[0].lower() == "stop":
+            text = "⏹ Stopping profiler, report follows." if profiler.stop() else "No profiling session running."
+        else:
+            try:
+                seconds, top_n = parse_profile_args(context.args)
+            except ValueError:
+                await update.message.reply_text("Usage: /profile [seconds] [top] or /profile stop")
+                return
+            if profiler.start(context.bot, update.effective_chat.id, seconds, top_n):
+                text = f"🔬 Profiling the event loop for {seconds:.0f}s (top {top_n})."
+            else:
+                text = "A profiling session is already running; /profile stop ends it."
 
         try:
-            await msg.edit_text(
-                f"🏓 <a href='https://t.me/SoulMeetsHQ'>Pong!</a> {response_time}ms",
-                parse_mode="HTML",
-                disable_web_page_preview=True
-            )
-            loggers['commands'].info(f"/ping completed with {response_time}ms latency")
+            await update.message.reply_text(text)
         except Exception as e:
-            loggers['errors'].error(f"Failed to edit ping message: {str(e)[:50]}")
+            loggers['errors'].error(f"Failed to send profile reply: {str(e)[:50]}")
 
     except Exception as e:
-        loggers['errors'].critical(f"Critical error in /ping: {str(e)[:50]}")
-        try:
-            await update.message.reply_text(ERROR_MESSAGES["ping_failed"])
-        except:
-            pass
+        loggers['errors'].critical(f"Critical error in /profile: {str(e)[:50]}")
 
 
-async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /broadcast command (owner only)."""
+async def memsnap_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /memsnap [top] and /memsnap stop (owner only) - tracemalloc snapshot diffs."""
     try:
         user_id = update.effective_user.id if update.effective_user else None
-        loggers['broadcast'].info(f"/broadcast from user {user_id}")
-        
+        loggers['profile'].info("/memsnap from user %s", user_id)
+
         if user_id != OWNER_ID:
-            loggers['broadcast'].warning(f"Unauthorized broadcast attempt from {user_id}")
+            loggers['profile'].warning(f"Unauthorized memsnap attempt from {user_id}")
             return
 
-        loggers['broadcast'].info("Authorized broadcast request from owner")
-
-        # Show typing action before showing broadcast menu  
-        await send_chat_action(context, update.effective_chat.id, ChatAction.TYPING)
+        if context.args and context.args[0].lower() == "stop":
+            text = "⏹ Memory tracing stopped." if profiler.stop_tracing() else "Memory tracing is not running."
+            await update.message.reply_text(text)
+            return
 
-        keyboard = [
-            [InlineKeyboardButton("👤 User", callback_data="broadcast_user"), 
-             InlineKeyboardButton("👥 Group", callback_data="broadcast_group")],
-            [InlineKeyboardButton("🌐 All", callback_data="broadcast_all"), 
-             InlineKeyboardButton("❌ Cancel", callback_data="broadcast_cancel")]
-        ]
-        
         try:
-            await update.message.reply_text("📢 Choose broadcast target:", reply_markup=InlineKeyboardMarkup(keyboard))
-            loggers['broadcast'].info("Broadcast menu sent to owner")
-        except Exception as e:
-            loggers['errors'].error(f"Failed to send broadcast menu: {str(e)[:50]}")
-            
+            top_n = int(context.args[0]) if context.args else None
+        except ValueError:
+            await update.message.reply_text("Usage: /memsnap [top] or /memsnap stop")
+            return
+
+        report = await asyncio.to_thread(profiler.memory_report, top_n)
+        await profiler.send_report(context.bot, update.effective_chat.id, report,
+                             f"memsnap-{int(time.time())}.txt", "🧠 Memory snapshot")
+
     except Exception as e:
-        loggers['errors'].critical(f"Critical error in /broadcast: {str(e)[:50]}")
+        loggers['errors'].critical(f"Critical error in /memsnap: {str(e)[:50]}")
 
 
 async def handle_broadcast_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -561,7 +3596,7 @@ async def handle_broadcast_choice(update: Update, context: ContextTypes.DEFAULT_
     try:
         query = update.callback_query
         user_id = query.from_user.id if query.from_user else None
-        loggers['broadcast'].info(f"Broadcast choice: {query.data} from user {user_id}")
+        loggers['broadcast'].info("Broadcast choice: %s from user %s", query.data, user_id)
         
         if query.data == "broadcast_cancel":
             try:
@@ -588,11 +3623,12 @@ async def handle_broadcast_choice(update: Update, context: ContextTypes.DEFAULT_
         loggers['errors'].critical(f"Critical error in broadcast choice handler: {str(e)[:50]}")
 
 
+@instrumented("handle_broadcast_content")
 async def handle_broadcast_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle broadcast message content."""
     try:
         user_id = update.effective_user.id
-        loggers['broadcast'].info(f"Processing broadcast content from user {user_id}")
+        loggers['broadcast'].info("Processing broadcast content from user %s", user_id)
 
         # Only handle if user is in broadcast mode
         if user_id not in broadcast_mode:
@@ -605,12 +3641,15 @@ async def handle_broadcast_content(update: Update, context: ContextTypes.DEFAULT
             loggers['errors'].error("No message found in broadcast content")
             return
             
-        loggers['broadcast'].info(f"Broadcasting to target: {target}")
+        loggers['broadcast'].info("Broadcasting to target: %s", target)
         
         # Determine message type and action
         message_type, chat_action = get_message_type_and_action(message)
         
         await send_chat_action(context, message.chat_id, chat_action)
+
+        # With several workers, each only saw its own chats since startup
+        await chat_registry.sync()
         
         # Determine target IDs based on selection
         if target == "users":
@@ -618,55 +3657,36 @@ async def handle_broadcast_content(update: Update, context: ContextTypes.DEFAULT
         elif target == "groups":
             ids = group_ids
         elif target == "all":
-            ids = user_ids.union(group_ids)
+            ids = user_ids.union(group_ids)  # streamed, not copied
         else:
             loggers['errors'].error(f"Unknown broadcast target: {target}")
             return
         
-        count = 0
-        failed_count = 0
+        # Leave out chats that blocked or removed the bot
+        ids = array("q", _difference(ids, dead_chat_ids))
         total_targets = len(ids)
+        loggers['broadcast'].info("Starting broadcast to %s %s", total_targets, target)
 
-        loggers['broadcast'].info(f"Starting broadcast to {total_targets} {target}")
-
-        for cid in list(ids):
-            try:
-                # Send appropriate chat action for each recipient
-                try:
-                    await context.bot.send_chat_action(chat_id=cid, action=chat_action)
-                except Exception:
-                    pass  # Ignore chat action failures
-                
-                await context.bot.copy_message(
-                    chat_id=cid,
-                    from_chat_id=update.message.chat_id,
-                    message_id=update.message.message_id
-                )
-                count += 1
-                await asyncio.sleep(0.05)
-                
-            except telegram.error.Forbidden:
-                failed_count += 1
-            except telegram.error.BadRequest:
-                failed_count += 1
-            except telegram.error.NetworkError:
-                failed_count += 1
-            except Exception:
-                failed_count += 1
-
-        loggers['broadcast'].info(f"Broadcast completed: {count} successful, {failed_count} failed")
-        
-        # Show typing action before sending completion message
-        await send_chat_action(context, message.chat_id, ChatAction.TYPING)
-        
         try:
-            result_text = f"📢 Broadcast sent to {count} {target}."
-            if failed_count > 0:
-                result_text += f"\n⚠️ {failed_count} failed to receive the message."
-            await update.message.reply_text(result_text)
-            loggers['broadcast'].info("Broadcast completion message sent")
+            progress_msg = await message.reply_text(
+                STATUS_MESSAGES["broadcast_progress"].format(
+                    total=total_targets, target=target, sent=0, failed=0, rate=0.0
+                )
+            )
         except Exception as e:
-            loggers['errors'].error(f"Failed to send broadcast completion: {str(e)[:50]}")
+            loggers['errors'].error(f"Failed to send broadcast progress message: {str(e)[:50]}")
+            progress_msg = None
+
+        job = broadcast_jobs.create(
+            from_chat_id=message.chat_id,
+            message_id=message.message_id,
+            targets=ids,
+            target_name=target,
+            progress_message_id=progress_msg.message_id if progress_msg else None,
+            chat_action=str(chat_action) if BROADCAST_CHAT_ACTIONS else None
+        )
+        broadcast_jobs.start(job)
+        loggers['broadcast'].info("Broadcast job %s started", job.job_id)
             
     except Exception as e:
         loggers['errors'].critical(f"Critical error in broadcast content handler: {str(e)[:50]}")
@@ -676,22 +3696,21 @@ async def handle_broadcast_content(update: Update, context: ContextTypes.DEFAULT
             pass
 
 
-async def handle_echo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@instrumented("handle_echo")
+async def handle_echo(update: Update, context: ContextTypes.DEFAULT_TYPE, info=None):
     """Handle echo feature for private chats and group replies to bot."""
     try:
         message = update.message
-        chat_type = message.chat.type
-        user_id = message.from_user.id if message.from_user else None
+        if info is None:
+            info = classify_update(update, context.bot.id)
+        user_id = info.user_id
 
         # Echo feature for private chats
-        if chat_type == "private":
-            loggers['echo'].info(f"Echo triggered in private chat for user {user_id}")
-            await react_to_message(update, context)
+        if info.is_private:
+            loggers['echo'].info("Echo triggered in private chat for user %s", user_id)
+            await react_to_message(update, context, info)
             
-            # Determine message type and send appropriate action
-            message_type, chat_action = get_message_type_and_action(message)
-            
-            await send_chat_action(context, message.chat_id, chat_action)
+            await send_chat_action(context, message.chat_id, info.chat_action)
             
             try:
                 await context.bot.copy_message(
@@ -709,14 +3728,11 @@ async def handle_echo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return True
 
         # Echo feature for group replies to bot
-        if message.reply_to_message and message.reply_to_message.from_user.id == context.bot.id:
-            loggers['echo'].info(f"Echo triggered in group for reply to bot from user {user_id}")
-            await react_to_message(update, context)
-            
-            # Determine message type and send appropriate action
-            message_type, chat_action = get_message_type_and_action(message)
+        if info.reply_to_bot:
+            loggers['echo'].info("Echo triggered in group for reply to bot from user %s", user_id)
+            await react_to_message(update, context, info)
             
-            await send_chat_action(context, message.chat_id, chat_action)
+            await send_chat_action(context, message.chat_id, info.chat_action)
             
             try:
                 await context.bot.copy_message(
@@ -741,6 +3757,7 @@ async def handle_echo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return False
 
 
+@instrumented("handle_message")
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle all incoming messages - includes echo feature and keyword triggering."""
     try:
@@ -749,25 +3766,29 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not message:
             return
 
-        chat_type = message.chat.type
-        user_id = user.id if user else None
-        chat_id = message.chat_id
+        # Classify once; react_to_message and handle_echo reuse the result
+        info = classify_update(update, context.bot.id)
+        chat_type = info.chat_type
+        user_id = info.user_id
+        chat_id = info.chat_id
 
-        logger.info(f"📥 Message from user {user_id} in {chat_type} chat {chat_id}")
+        logger.info("📥 Message from user %s in %s chat %s", user_id, chat_type, chat_id)
 
         # Track chat ID
-        track_chat_id(message.chat_id, chat_type)
+        track_chat_id(chat_id, chat_type)
 
-        text = message.text or ""
-        lowered = text.lower()
-
-        logger.debug(f"📝 Message text: '{text[:50]}{'...' if len(text) > 50 else ''}'")
+        logger.debug("📝 Message text: '%.50s%s'", info.text, "..." if len(info.text) > 50 else "")
 
         # Handle keyword trigger in any chat
-        if TRIGGER_KEYWORD in lowered:
-            logger.info(f"🎯 Keyword '{TRIGGER_KEYWORD}' triggered by user {user_id}")
-            await react_to_message(update, context)
-            reply_id = message.message_id if chat_type in ["group", "supergroup"] else None
+        if info.triggers:
+            if not allow_image_trigger(chat_id, user_id):
+                if FLOOD_THROTTLED_ACTION == "react":
+                    await react_to_message(update, context, info)
+                return
+
+            logger.info("🎯 Keywords %s triggered by user %s", info.triggers, user_id)
+            await react_to_message(update, context, info)
+            reply_id = message.message_id if info.is_group else None
             
             # Show typing action before sending emoji message
             await send_chat_action(context, message.chat_id, ChatAction.TYPING)
@@ -779,17 +3800,17 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text=emoji_msg,
                     reply_to_message_id=reply_id
                 )
-                logger.debug(f"✅ Keyword response emoji sent to chat {chat_id}")
+                logger.debug("✅ Keyword response emoji sent to chat %s", chat_id)
                 
                 await send_image(message.chat_id, user, context.bot, loading_msg=loading_msg)
-                logger.info(f"✅ Keyword response completed for user {user_id}")
+                logger.info("✅ Keyword response completed for user %s", user_id)
                 
             except Exception as e:
                 logger.error(f"❌ Error in keyword response: {e}")
             return
 
         # Handle echo feature
-        echo_handled = await handle_echo(update, context)
+        echo_handled = await handle_echo(update, context, info)
         if echo_handled:
             logger.debug("✅ Message handled by echo feature")
         else:
@@ -809,6 +3830,49 @@ async def set_bot_commands(application):
         logger.error(f"❌ Failed to set bot commands: {e}")
 
 
+async def start_services(application, leader=True):
+    """Start the services the update handlers rely on.
+
+    Only the leader refills the image pool and pre-warms the cache chat; see WorkerLeader.
+    """
+    await chat_registry.start()
+    await http_client.start()
+    file_id_cache.prewarming = leader
+    file_id_cache.start(application.bot)
+    await image_sources.start()
+    if leader:
+        image_pool.start()
+    broadcast_jobs.resume_interrupted(application.bot)
+
+
+async def stop_services():
+    """Stop the services started by start_services."""
+    await image_pool.stop()
+    await file_id_cache.stop()
+    await http_client.close()
+    await chat_registry.stop()
+
+
+async def post_init(application):
+    """Run startup tasks once the application is initialized."""
+    await set_bot_commands(application)
+    await start_services(application)
+    await web_server.start(application)
+    health_monitor.start(application)
+
+
+async def post_stop(application):
+    """Checkpoint running broadcasts while the bot can still edit messages."""
+    await broadcast_jobs.shutdown()
+
+
+async def post_shutdown(application):
+    """Release background resources on shutdown."""
+    await health_monitor.stop()
+    await web_server.stop()
+    await stop_services()
+
+
 class BroadcastFilter(filters.MessageFilter):
     """Custom filter for broadcast messages."""
 
@@ -819,13 +3883,92 @@ class BroadcastFilter(filters.MessageFilter):
                 return False
             user_id = message.from_user.id
             is_in_broadcast_mode = user_id == OWNER_ID and user_id in broadcast_mode
-            logger.debug(f"🔍 BroadcastFilter: user_id={user_id}, owner_id={OWNER_ID}, in_broadcast_mode={user_id in broadcast_mode}, result={is_in_broadcast_mode}")
+            logger.debug("🔍 BroadcastFilter: user_id=%s, owner_id=%s, in_broadcast_mode=%s, result=%s", user_id, OWNER_ID, user_id in broadcast_mode, is_in_broadcast_mode)
             return is_in_broadcast_mode
         except Exception as e:
             logger.error(f"❌ Error in BroadcastFilter: {e}")
             return False
 
 
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently across chats while keeping each chat in order."""
+
+    def __init__(self, concurrency=UPDATE_CONCURRENCY, max_pending=UPDATE_MAX_PENDING):
+        # The base class semaphore only bounds pending updates; the running limit is
+        # only taken once the chat lock is held, so a chat with a long backlog cannot
+        # occupy slots other chats need
+        super().__init__(max(max_pending, concurrency))
+        self.concurrency = concurrency
+        self._running = asyncio.BoundedSemaphore(concurrency)
+        self._chat_locks = {}
+        self.active = 0
+        # Updates waiting for their chat or for a running slot
+        self.waiting = 0
+
+    @property
+    def current_concurrent_updates(self):
+        return self.active
+
+    @staticmethod
+    def _chat_key(update):
+        chat = getattr(update, "effective_chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(update, "effective_user", None)
+        return ("user", user.id) if user is not None else None
+
+    async def do_process_update(self, update, coroutine):
+        """Wait for the update's chat, then for a running slot, then run it."""
+        key = self._chat_key(update)
+        entry = None
+        if key is not None:
+            entry = self._chat_locks.get(key)
+            if entry is None:
+                entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+        self.waiting += 1
+        started = False
+        try:
+            if entry is not None:
+                await entry[0].acquire()
+            try:
+                async with self._running:
+                    self.waiting -= 1
+                    started = True
+                    self.active += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self.active -= 1
+            finally:
+                if entry is not None:
+                    entry[0].release()
+        finally:
+            if not started:
+                self.waiting -= 1
+                # Cancelled while waiting; close the handler coroutine so it is not reported as never awaited
+                if asyncio.iscoroutine(coroutine):
+                    coroutine.close()
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._chat_locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+update_processor = PerChatUpdateProcessor()
+metrics.describe("updates_in_flight", "gauge", "Updates running or waiting for their chat.")
+metrics.gauge("updates_in_flight", lambda: {
+    (("state", "running"),): update_processor.active,
+    (("state", "pending"),): update_processor.waiting,
+})
+
+
 def setup_bot():
     """Create and configure the bot application."""
     try:
@@ -835,7 +3978,17 @@ def setup_bot():
             logger.critical("💥 BOT_TOKEN is not set!")
             raise ValueError("BOT_TOKEN environment variable is required")
             
-        app = ApplicationBuilder().token(BOT_TOKEN).defaults(Defaults(parse_mode="HTML")).build()
+        app = (
+            ApplicationBuilder()
+            .token(BOT_TOKEN)
+            .base_url(f"{TELEGRAM_API_URL}/bot")
+            .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+            .defaults(Defaults(parse_mode="HTML"))
+            .request(TrackedRequest(connection_pool_size=256))
+            .get_updates_request(TrackedRequest(connection_pool_size=1))
+            .concurrent_updates(update_processor)
+            .build()
+        )
         logger.info("✅ Bot application created successfully")
 
         logger.info("🔧 Setting up bot handlers...")
@@ -844,6 +3997,13 @@ def setup_bot():
         app.add_handler(CommandHandler("start", start_command))
         app.add_handler(CommandHandler("ping", ping_command))
         app.add_handler(CommandHandler("broadcast", broadcast_command))
+        app.add_handler(CommandHandler("httpstats", httpstats_command))
+        app.add_handler(CommandHandler("chats", chats_command))
+        app.add_handler(CommandHandler("keywords", keywords_command))
+        app.add_handler(CommandHandler("jobs", jobs_command))
+        app.add_handler(CommandHandler(["pausejob", "resumejob", "canceljob"], job_control_command))
+        app.add_handler(CommandHandler("profile", profile_command))
+        app.add_handler(CommandHandler("memsnap", memsnap_command))
         app.add_handler(CallbackQueryHandler(handle_broadcast_choice, pattern="^broadcast_"))
         logger.info("✅ Command handlers added")
 
@@ -859,7 +4019,9 @@ def setup_bot():
         app.add_handler(MessageHandler(filters.ALL & (~filters.COMMAND), handle_message))
         logger.info("✅ Message handler added")
 
-        app.post_init = set_bot_commands
+        app.post_init = post_init
+        app.post_stop = post_stop
+        app.post_shutdown = post_shutdown
         logger.info("✅ Bot handlers setup complete")
         return app
         
@@ -868,49 +4030,651 @@ def setup_bot():
         raise
 
 
-class HealthCheckHandler(BaseHTTPRequestHandler):
-    """HTTP handler for health checks."""
+class TrackedRequest(HTTPXRequest):
+    """HTTPXRequest that records Bot API calls for readiness checks and metrics."""
 
-    def do_GET(self):
+    async def post(self, url, request_data=None, **kwargs):
+        labels = (("method", url.rsplit("/", 1)[-1]),)
+        metrics.inc("bot_api_calls_total", labels=labels)
         try:
-            logger.debug("🌐 Health check GET request received")
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(STATUS_MESSAGES["server_alive"].encode())
-            logger.debug("✅ Health check response sent")
-        except Exception as e:
-            logger.error(f"❌ Error in health check GET: {e}")
+            return await super().post(url, request_data=request_data, **kwargs)
+        except telegram.error.TelegramError as e:
+            metrics.inc("bot_api_errors_total", labels=labels + (("error", type(e).__name__),))
+            raise
 
-    def do_HEAD(self):
-        try:
-            logger.debug("🌐 Health check HEAD request received")
-            self.send_response(200)
-            self.end_headers()
-            logger.debug("✅ Health check HEAD response sent")
-        except Exception as e:
-            logger.error(f"❌ Error in health check HEAD: {e}")
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        code, payload = await super().do_request(url, method, request_data=request_data, **kwargs)
+        if 200 <= code < 300:
+            health_monitor.record_api_success()
+        return code, payload
 
-    def log_message(self, format, *args):
-        """Suppress HTTP server logs."""
-        pass
+
+class HealthMonitor:
+    """Tracks the signals behind the /healthz and /readyz endpoints."""
+
+    def __init__(self, api_max_age=READY_API_MAX_AGE, probe_interval=READY_API_PROBE_INTERVAL,
+                 max_loop_lag=READY_MAX_LOOP_LAG, max_queue_depth=READY_MAX_QUEUE_DEPTH,
+                 lag_interval=LOOP_LAG_INTERVAL):
+        self.api_max_age = api_max_age
+        self.probe_interval = probe_interval
+        self.max_loop_lag = max_loop_lag
+        self.max_queue_depth = max_queue_depth
+        self.lag_interval = lag_interval
+        self.started = False
+        self.last_api_success = None
+        self.loop_lag = 0.0
+        self.application = None
+        self._tasks = []
+
+    def record_api_success(self):
+        self.last_api_success = time.monotonic()
+
+    def queue_depth(self):
+        """Updates waiting to be processed plus uploads waiting to be pre-warmed."""
+        depth = file_id_cache.backlog() + worker_pool.backlog() + update_processor.waiting
+        if self.application is not None:
+            depth += self.application.update_queue.qsize()
+        return depth
+
+    def readiness(self):
+        """Return (ready, checks) describing whether this instance should take traffic."""
+        api_age = None
+        if self.last_api_success is not None:
+            api_age = time.monotonic() - self.last_api_success
+        queue_depth = self.queue_depth()
+        checks = {
+            "initialized": self.started,
+            "api": api_age is not None and api_age <= self.api_max_age,
+            "event_loop": self.loop_lag <= self.max_loop_lag,
+            "queue": queue_depth <= self.max_queue_depth,
+        }
+        details = {
+            "api_age": round(api_age, 1) if api_age is not None else None,
+            "loop_lag": round(self.loop_lag, 3),
+            "queue_depth": queue_depth,
+        }
+        return all(checks.values()), {"checks": checks, **details}
+
+    async def _measure_loop_lag(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.lag_interval)
+            self.loop_lag = max(0.0, time.monotonic() - started - self.lag_interval)
+            if self.loop_lag > self.max_loop_lag:
+                loggers['health'].warning(f"Event loop lag {self.loop_lag:.2f}s")
+
+    async def _probe_api(self):
+        # Webhook mode has no getUpdates traffic, so an idle bot needs an explicit probe
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            if self.last_api_success and time.monotonic() - self.last_api_success < self.probe_interval:
+                continue
+            try:
+                await self.application.bot.get_me()
+            except Exception as e:
+                loggers['health'].warning(f"Bot API probe failed: {str(e)[:50]}")
+
+    def start(self, application):
+        """Mark the bot initialized and start the background probes."""
+        self.application = application
+        self.started = True
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._measure_loop_lag()),
+                asyncio.create_task(self._probe_api()),
+            ]
+
+    async def stop(self):
+        self.started = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+health_monitor = HealthMonitor()
+
+
+async def handle_health(request):
+    """Liveness: answering at all means the event loop is running."""
+    return web.Response(text=STATUS_MESSAGES["server_alive"])
 
 
-def start_health_server():
-    """Start HTTP server for health checks."""
+async def handle_ready(request):
+    """Readiness: initialized, recently talked to Telegram, loop and queues healthy."""
+    ready, details = health_monitor.readiness()
+    return web.json_response({"ready": ready, **details}, status=200 if ready else 503)
+
+
+async def handle_metrics(request):
+    """Expose metrics in the Prometheus text format."""
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+
+async def handle_webhook(request):
+    """Validate a Telegram webhook request and queue its update."""
+    application = request.app["application"]
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(token, WEBHOOK_SECRET):
+        loggers['webhook'].warning(f"Rejected webhook request from {request.remote}")
+        return web.Response(status=403)
+
     try:
-        logger.info("🌐 Starting HTTP health check server")
-        port = int(os.environ.get("PORT", 5000))
-        
-        server = HTTPServer(("0.0.0.0", port), HealthCheckHandler)
-        logger.info(f"✅ HTTP server listening on 0.0.0.0:{port}")
-        server.serve_forever()
-        
-    except OSError as e:
-        logger.error(f"❌ Failed to bind to port {port}: {e}")
-        raise
+        data = await request.json()
+        update = Update.de_json(data, application.bot)
     except Exception as e:
-        logger.critical(f"💥 Critical error starting HTTP server: {e}")
-        raise
+        loggers['webhook'].warning(f"Invalid webhook payload: {str(e)[:50]}")
+        return web.Response(status=400)
+
+    await application.update_queue.put(update)
+    return web.Response()
+
+
+def create_web_app(application):
+    """Build the aiohttp app serving health, readiness and (in webhook mode) updates."""
+    web_app = web.Application()
+    web_app["application"] = application
+    if WEBHOOK_URL:
+        web_app.router.add_post(WEBHOOK_PATH, handle_webhook)
+    web_app.router.add_get("/healthz", handle_health)
+    web_app.router.add_get("/readyz", handle_ready)
+    web_app.router.add_get("/metrics", handle_metrics)
+    web_app.router.add_get("/{tail:.*}", handle_health)
+    return web_app
+
+
+class WebServer:
+    """aiohttp server running on the bot's own event loop."""
+
+    def __init__(self):
+        self._runner = None
+
+    async def start(self, application):
+        if self._runner is not None:
+            return
+        port = int(os.environ.get("PORT", 5000))
+        runner = web.AppRunner(create_web_app(application), access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, "0.0.0.0", port).start()
+        except OSError as e:
+            logger.error(f"❌ Failed to bind to port {port}: {e}")
+            await runner.cleanup()
+            raise
+        self._runner = runner
+        logger.info("✅ HTTP server listening on 0.0.0.0:%s", port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+web_server = WebServer()
+
+
+async def run_webhook(application):
+    """Run the bot in webhook mode; post_init has already started the web server."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+
+        await application.bot.set_webhook(
+            url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES
+        )
+        loggers['webhook'].info("Webhook set to %s%s", WEBHOOK_URL, WEBHOOK_PATH)
+
+        await application.start()
+        await stop_event.wait()
+        logger.info("👋 Stop signal received, shutting down")
+    finally:
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+class HashRing:
+    """Consistent hash ring mapping chat ids to workers, with virtual nodes for balance."""
+
+    def __init__(self, vnodes=WORKER_VNODES):
+        self.vnodes = vnodes
+        self.members = set()
+        self._points = []
+        self._owners = []
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+    def add(self, worker_id):
+        self.members.add(worker_id)
+        for replica in range(self.vnodes):
+            point = self._hash(f"{worker_id}#{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, worker_id)
+
+    def remove(self, worker_id):
+        self.members.discard(worker_id)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != worker_id]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def owner(self, key):
+        """Return the worker responsible for key, or None if the ring is empty."""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+class WorkerPool:
+    """Front-process side of multi-worker mode: runs worker processes and routes updates to them by chat."""
+
+    def __init__(self, size=WORKERS, vnodes=WORKER_VNODES, stop_timeout=WORKER_STOP_TIMEOUT):
+        self.size = size
+        self.stop_timeout = stop_timeout
+        self.ring = HashRing(vnodes)
+        self._context = multiprocessing.get_context("spawn")
+        self._outbox = None
+        self._processes = {}
+        self._inboxes = {}
+        # worker_id -> {update_id: (route key, payload)} sent but not yet finished, in send order
+        self._unacked = {}
+        self._waiters = {}
+        # Updates routed while a worker joins or leaves; sent once the ring is settled
+        self._held = None
+        self._leaving = set()
+        self._next_id = 0
+        self._membership = asyncio.Lock()
+        self._tasks = []
+        self._stopping = False
+
+    def backlog(self):
+        """Updates routed to workers that they have not finished yet."""
+        return sum(len(pending) for pending in self._unacked.values()) + len(self._held or ())
+
+    @staticmethod
+    def route_key(update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return update.update_id
+
+    def dispatch(self, update):
+        """Send an update to the worker that owns its chat."""
+        item = (self.route_key(update), update.update_id, update.to_json())
+        if self._held is not None:
+            self._held.append(item)
+        else:
+            self._send(*item)
+
+    def _send(self, key, update_id, payload):
+        worker_id = self.ring.owner(key)
+        self._unacked[worker_id][update_id] = (key, payload)
+        self._inboxes[worker_id].put(("update", update_id, payload))
+        metrics.inc("worker_updates_routed_total", labels=(("worker", str(worker_id)),))
+
+    def _release_held(self):
+        held, self._held = self._held, None
+        for item in held:
+            self._send(*item)
+
+    def _spawn(self, worker_id):
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=worker_main,
+            args=(worker_id, inbox, self._outbox, os.getpid()),
+            name=f"copycat-worker-{worker_id}",
+        )
+        process.start()
+        self._processes[worker_id] = process
+        self._inboxes[worker_id] = inbox
+        self._unacked.setdefault(worker_id, {})
+        loggers['workers'].info("Started worker %s (pid %s)", worker_id, process.pid)
+
+    async def start(self):
+        self._stopping = False
+        self._outbox = self._context.Queue()
+        for _ in range(self.size):
+            worker_id = self._next_id
+            self._next_id += 1
+            self._spawn(worker_id)
+            self.ring.add(worker_id)
+        self._tasks = [asyncio.create_task(self._read_outbox()), asyncio.create_task(self._monitor())]
+        loop = asyncio.get_running_loop()
+        for sig, action in ((signal.SIGUSR1, self.add_worker), (signal.SIGUSR2, self.remove_worker)):
+            try:
+                loop.add_signal_handler(sig, lambda action=action: asyncio.create_task(action()))
+            except (NotImplementedError, AttributeError):
+                pass
+        loggers['workers'].info("Routing updates to %s workers", self.size)
+
+    async def stop(self):
+        """Let every worker finish its updates, then stop them."""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGUSR1, signal.SIGUSR2):
+            try:
+                loop.remove_signal_handler(sig)
+            except (NotImplementedError, AttributeError):
+                pass
+        async with self._membership:
+            workers = sorted(self._processes)
+            await asyncio.gather(*(self._request("stop", worker_id) for worker_id in workers))
+            for worker_id in workers:
+                self._join(worker_id)
+            if self.backlog():
+                loggers['workers'].warning("Stopped workers with %s updates unfinished", self.backlog())
+            self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _join(self, worker_id):
+        process = self._processes.pop(worker_id)
+        self._inboxes.pop(worker_id)
+        process.join(5)
+        if process.is_alive():
+            loggers['workers'].warning("Worker %s did not exit, terminating it", worker_id)
+            process.terminate()
+            process.join(5)
+
+    async def _request(self, kind, worker_id):
+        """Send a control message to a worker and wait until it is acknowledged."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[(kind, worker_id)] = future
+        self._inboxes[worker_id].put((kind,))
+        try:
+            await asyncio.wait_for(future, self.stop_timeout)
+            return True
+        except asyncio.TimeoutError:
+            loggers['workers'].warning("Worker %s did not acknowledge %s within %ss", worker_id, kind, self.stop_timeout)
+            return False
+        finally:
+            self._waiters.pop((kind, worker_id), None)
+
+    async def _read_outbox(self):
+        while not self._stopping:
+            try:
+                messages = await asyncio.to_thread(_drain_queue, self._outbox, 0.5)
+            except Exception as e:
+                loggers['errors'].error(f"Failed to read worker messages: {str(e)[:50]}")
+                await asyncio.sleep(0.5)
+                continue
+            for message in messages:
+                kind, worker_id = message[0], message[1]
+                if kind == "done":
+                    self._unacked.get(worker_id, {}).pop(message[2], None)
+                    continue
+                waiter = self._waiters.get((kind, worker_id))
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(True)
+
+    async def _monitor(self):
+        """Replace workers that died, redelivering what they had not finished."""
+        while not self._stopping:
+            await asyncio.sleep(1)
+            for worker_id, process in list(self._processes.items()):
+                if not process.is_alive() and worker_id not in self._leaving and not self._stopping:
+                    await self._replace(worker_id)
+
+    async def _replace(self, worker_id):
+        async with self._membership:
+            process = self._processes.get(worker_id)
+            if process is None or process.is_alive():
+                return
+            loggers['errors'].error(f"Worker {worker_id} exited with code {process.exitcode}, restarting it")
+            metrics.inc("worker_restarts_total")
+            self._processes.pop(worker_id)
+            self._inboxes.pop(worker_id)
+            pending = self._unacked.pop(worker_id, {})
+            # Same id, so the ring and every chat's owner stay as they were
+            self._spawn(worker_id)
+            for update_id, (key, payload) in pending.items():
+                self._send(key, update_id, payload)
+
+    async def add_worker(self):
+        """Start one more worker and move its share of chats to it."""
+        async with self._membership:
+            worker_id = self._next_id
+            self._next_id += 1
+            self._held = []
+            try:
+                self._spawn(worker_id)
+                # Chats that move must not start on the new worker while their old owner is still busy with them
+                await asyncio.gather(*(self._request("barrier", other) for other in sorted(self.ring.members)))
+                self.ring.add(worker_id)
+            finally:
+                self._release_held()
+            loggers['workers'].info("Worker %s joined, %s workers now", worker_id, len(self.ring.members))
+
+    async def remove_worker(self, worker_id=None):
+        """Stop a worker (the newest by default) and hand its chats to the others."""
+        async with self._membership:
+            if len(self.ring.members) <= 1:
+                loggers['workers'].warning("Not removing the last worker")
+                return False
+            if worker_id is None:
+                worker_id = max(self.ring.members)
+            self._leaving.add(worker_id)
+            self._held = []
+            try:
+                await self._request("stop", worker_id)
+                self.ring.remove(worker_id)
+                await asyncio.to_thread(self._join, worker_id)
+                # Whatever it did not finish goes to the chats' new owners, ahead of anything held
+                pending = self._unacked.pop(worker_id, {})
+                if pending:
+                    loggers['workers'].warning("Redelivering %s updates from worker %s", len(pending), worker_id)
+                for update_id, (key, payload) in pending.items():
+                    self._send(key, update_id, payload)
+            finally:
+                self._leaving.discard(worker_id)
+                self._release_held()
+            loggers['workers'].info("Worker %s left, %s workers now", worker_id, len(self.ring.members))
+            return True
+
+
+worker_pool = WorkerPool()
+
+metrics.describe("workers", "gauge", "Worker processes receiving updates (multi-worker mode).")
+metrics.describe("worker_backlog", "gauge", "Updates routed to each worker and not yet finished.")
+metrics.describe("worker_updates_routed_total", "counter", "Updates routed to each worker.")
+metrics.describe("worker_restarts_total", "counter", "Worker processes restarted after exiting unexpectedly.")
+# Both gauges are empty in single-process mode
+metrics.gauge("workers", lambda: {(): len(worker_pool.ring.members)} if worker_pool.ring.members else {})
+metrics.gauge("worker_backlog", lambda: {
+    (("worker", str(worker_id)),): len(pending) for worker_id, pending in worker_pool._unacked.items()
+})
+
+
+def _drain_queue(source, timeout, limit=256):
+    """Block for one message, then take whatever else is already queued."""
+    try:
+        messages = [source.get(True, timeout)]
+    except queue.Empty:
+        return []
+    while len(messages) < limit:
+        try:
+            messages.append(source.get_nowait())
+        except queue.Empty:
+            break
+    return messages
+
+
+class WorkerLeader:
+    """Elects, by file lock, the one worker that runs the shared background work."""
+
+    def __init__(self, path=WORKER_LEADER_LOCK, poll=WORKER_LEADER_POLL):
+        self.path = path
+        self.poll = poll
+        self._handle = None
+        self._task = None
+
+    @property
+    def held(self):
+        return self._handle is not None
+
+    def acquire(self):
+        """Take the lock if no other worker holds it; return whether this worker leads."""
+        if self._handle is not None:
+            return True
+        try:
+            handle = open(self.path, "w")
+        except OSError as e:
+            loggers['errors'].error(f"Failed to open worker leader lock: {str(e)[:50]}")
+            return False
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._handle = handle
+        file_id_cache.prewarming = True
+        image_pool.start()
+        loggers['workers'].info("Worker process %s now refills the image pool and pre-warms the cache chat", os.getpid())
+        return True
+
+    async def run(self):
+        """Retry the lock until this worker leads, e.g. after the leader was removed."""
+        while not self.acquire():
+            await asyncio.sleep(self.poll)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop waiting for the lock and give it up, letting another worker take over."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._handle is not None:
+            await image_pool.stop()
+            self._handle.close()
+            self._handle = None
+
+
+worker_leader = WorkerLeader()
+
+
+async def run_worker(worker_id, inbox, outbox, parent_pid):
+    """Process the updates the front process routes to this worker until told to stop."""
+    application = setup_bot()
+    await application.initialize()
+    await start_services(application, leader=False)
+    worker_leader.start()
+    in_flight = set()
+
+    async def process(update_id, payload):
+        try:
+            update = Update.de_json(json.loads(payload), application.bot)
+            await application.update_processor.process_update(update, application.process_update(update))
+        except Exception as e:
+            loggers['errors'].error(f"Worker {worker_id} failed on update {update_id}: {str(e)[:50]}")
+        finally:
+            outbox.put(("done", worker_id, update_id))
+
+    loggers['workers'].info("Worker %s ready", worker_id)
+    try:
+        while True:
+            messages = await asyncio.to_thread(_drain_queue, inbox, 1.0)
+            if not messages and os.getppid() != parent_pid:
+                loggers['workers'].warning("Front process is gone, worker %s exiting", worker_id)
+                return
+            for message in messages:
+                if message[0] == "update":
+                    task = asyncio.create_task(process(message[1], message[2]))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+                    continue
+                # Control messages ("barrier", "stop") wait for everything received before them
+                if in_flight:
+                    await asyncio.gather(*list(in_flight), return_exceptions=True)
+                if message[0] == "stop":
+                    return
+                outbox.put((message[0], worker_id))
+    finally:
+        await worker_leader.stop()
+        await broadcast_jobs.shutdown()
+        await application.shutdown()
+        await stop_services()
+        outbox.put(("stop", worker_id))
+
+
+def worker_main(worker_id, inbox, outbox, parent_pid):
+    """Entry point of a worker process."""
+    # The front process decides when workers stop, after draining them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    if file_id_cache.path:
+        file_id_cache.path = f"{file_id_cache.path}.{worker_id}"
+    chat_registry.shared = True
+    chat_registry.load()
+    asyncio.run(run_worker(worker_id, inbox, outbox, parent_pid))
+
+
+async def route_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Front-process handler: hand every update to the worker owning its chat."""
+    worker_pool.dispatch(update)
+
+
+async def router_post_init(application):
+    await set_bot_commands(application)
+    await worker_pool.start()
+    await web_server.start(application)
+    health_monitor.start(application)
+
+
+async def router_post_shutdown(application):
+    await health_monitor.stop()
+    await web_server.stop()
+    await worker_pool.stop()
+
+
+def setup_router():
+    """Create the front application that routes updates to WORKERS worker processes."""
+    if not BOT_TOKEN:
+        logger.critical("💥 BOT_TOKEN is not set!")
+        raise ValueError("BOT_TOKEN environment variable is required")
+
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .request(TrackedRequest(connection_pool_size=8))
+        .get_updates_request(TrackedRequest(connection_pool_size=1))
+        .build()
+    )
+    app.post_init = router_post_init
+    app.post_shutdown = router_post_shutdown
+    # Updates are handed off one at a time, in arrival order, so each worker sees its chats in order
+    app.add_handler(TypeHandler(Update, route_update))
+    logger.info("✅ Front process set up for %s workers", WORKERS)
+    return app
 
 
 def main():
@@ -928,20 +4692,29 @@ def main():
             logger.warning("⚠️ OWNER_ID not set - broadcast functionality will be disabled")
 
         logger.info(f"🤖 Bot Token: {'*' * (len(BOT_TOKEN) - 8) + BOT_TOKEN[-8:]}")
-        logger.info(f"👑 Owner ID: {OWNER_ID}")
-        logger.info(f"🔑 Trigger Keyword: {TRIGGER_KEYWORD}")
+        logger.info("👑 Owner ID: %s", OWNER_ID)
+        logger.info("🔑 Trigger Keywords: %s", ", ".join(TRIGGER_KEYWORDS))
 
-        app = setup_bot()
+        if WORKERS > 1:
+            # Workers load the chat registry and run the handlers; this process only routes
+            app = setup_router()
+        else:
+            app = setup_bot()
         logger.info("✅ Bot is running with anime, echo, and broadcast features 👻")
 
-        # Log initial stats
-        logger.info(f"📊 Initial Stats - Users: {len(user_ids)}, Groups: {len(group_ids)}")
+        # Load known chats and log initial stats
+        if WORKERS <= 1:
+            chat_registry.load()
+            logger.info("📊 Initial Stats - Users: %s, Groups: %s", len(user_ids), len(group_ids))
         
         print("="*60)
         print("✅ Bot is now running! Press Ctrl+C to stop.")
         print("="*60 + "\n")
 
-        app.run_polling()
+        if WEBHOOK_URL:
+            asyncio.run(run_webhook(app))
+        else:
+            app.run_polling()
         
     except KeyboardInterrupt:
         print("\n" + "="*60)
@@ -959,11 +4732,6 @@ def main():
 
 if __name__ == "__main__":
     try:
-        # Start HTTP server in background thread
-        server_thread = threading.Thread(target=start_health_server, daemon=True)
-        server_thread.start()
-        logger.info("✅ HTTP server thread started")
-        
         # Start main bot
         main()
         